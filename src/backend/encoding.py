@@ -0,0 +1,196 @@
+import gzip
+import json
+import struct
+
+import numpy as np
+
+from melolib.midi import NOTE_DTYPE, TrackNotes, notes_from_dicts
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is always offered
+    brotli = None
+try:
+    import msgpack
+except ImportError:  # Optional, the columns format needs no dependency
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/vnd.msgpack"
+COLUMNS = "application/vnd.melowave.columns"
+
+# Offered in order of preference for equally acceptable types, JSON first so
+# clients that accept anything keep getting it
+FORMATS = [JSON, COLUMNS] + ([MSGPACK] if msgpack is not None else [])
+ENCODINGS = (["br"] if brotli is not None else []) + ["gzip", "identity"]
+
+COLUMNS_MAGIC = b"MWC1"
+# Columns of every midi track and score in the binary formats, little endian.
+# Score entries refer to their notation by index into the score's notations.
+TRACK_COLUMNS = {
+    "start_tick": np.dtype("<u4"),
+    "end_tick": np.dtype("<u4"),
+    "pitch": np.dtype("u1"),
+    "velocity": np.dtype("u1"),
+}
+SCORE_COLUMNS = {
+    "start_tick": np.dtype("<u4"),
+    "end_tick": np.dtype("<u4"),
+    "notation": np.dtype("<u4"),
+}
+ALIGNMENT = 4  # Columns start at multiples of this, so they can be viewed in place
+
+
+def best_format(accept_mimetypes):
+    return accept_mimetypes.best_match(FORMATS, default=JSON)
+
+
+def best_encoding(accept_encodings):
+    return accept_encodings.best_match(ENCODINGS, default="identity")
+
+
+def _column(values, dtype):
+    values = np.asarray(values)
+    if len(values) and values.max() > np.iinfo(dtype).max:
+        raise ValueError(f"Values don't fit the columnar encoding's {dtype}")
+    return values.astype(dtype)
+
+
+def track_columns(track_data):
+    # The columns of a track's TrackNotes or note dicts
+    notes = notes_from_dicts(track_data)
+    return {name: _column(notes[name], dtype) for name, dtype in TRACK_COLUMNS.items()}
+
+
+def score_columns(score_data, dumps=json.dumps):
+    # The columns of a score's entries and the distinct notations they index
+    indices, notations, notation_column = {}, [], []
+    for entry in score_data:
+        index = indices.setdefault(dumps(entry["notation"]), len(notations))
+        if index == len(notations):
+            notations.append(entry["notation"])
+        notation_column.append(index)
+    columns = {
+        "start_tick": [entry["start_tick"] for entry in score_data],
+        "end_tick": [entry["end_tick"] for entry in score_data],
+        "notation": notation_column,
+    }
+    return notations, {
+        name: _column(columns[name], dtype) for name, dtype in SCORE_COLUMNS.items()
+    }
+
+
+def split_columns(song, dumps=json.dumps):
+    """Splits the notes of midi tracks and entries of scores into columns.
+
+    Returns the song with every track and score's data replaced by its
+    count, scores also listing their notations, and the columns in order.
+    """
+    tracks, scores, columns = [], [], []
+    for track in song["midi"]["tracks"]:
+        tracks.append({"name": track["name"], "count": len(track["data"])})
+        columns.append(track_columns(track["data"]))
+    for score in song["scores"]:
+        notations, score_data = score_columns(score["data"], dumps)
+        header = {key: value for key, value in score.items() if key != "data"}
+        scores.append({**header, "count": len(score["data"]), "notations": notations})
+        columns.append(score_data)
+    header = {**song, "scores": scores, "midi": {**song["midi"], "tracks": tracks}}
+    return header, columns
+
+
+def _notes(columns):
+    notes = np.zeros(len(columns["pitch"]), dtype=NOTE_DTYPE)
+    for name, column in columns.items():
+        notes[name] = column
+    return notes
+
+
+def join_columns(header, columns):
+    # The song split_columns split, with TrackNotes views as track data
+    columns = iter(columns)
+    tracks = [
+        {"name": track["name"], "data": TrackNotes(_notes(next(columns)))}
+        for track in header["midi"]["tracks"]
+    ]
+    scores = []
+    for score in header["scores"]:
+        score_data = next(columns)
+        notations = score["notations"]
+        data = [
+            {"start_tick": start, "end_tick": end, "notation": notations[notation]}
+            for start, end, notation in zip(
+                score_data["start_tick"].tolist(),
+                score_data["end_tick"].tolist(),
+                score_data["notation"].tolist(),
+            )
+        ]
+        score = {k: v for k, v in score.items() if k not in ("count", "notations")}
+        scores.append({**score, "data": data})
+    return {**header, "scores": scores, "midi": {**header["midi"], "tracks": tracks}}
+
+
+def encode_columns(song, dumps=json.dumps):
+    """Encodes a song as a JSON header followed by typed array columns.
+
+    The body is COLUMNS_MAGIC, the little endian uint32 length of the
+    split_columns header and the header. Then come the TRACK_COLUMNS of every
+    track and SCORE_COLUMNS of every score in order, each padded to start at
+    a multiple of ALIGNMENT bytes.
+    """
+    header, columns = split_columns(song, dumps)
+    header = dumps(header).encode()
+    parts = [COLUMNS_MAGIC, struct.pack("<I", len(header)), header]
+    size = sum(map(len, parts))
+    for column in (column for group in columns for column in group.values()):
+        padding = -size % ALIGNMENT
+        parts += [b"\0" * padding, column.tobytes()]
+        size += padding + column.nbytes
+    return b"".join(parts)
+
+
+def decode_columns(body, loads=json.loads):
+    if not body.startswith(COLUMNS_MAGIC):
+        raise ValueError("Not a columnar song")
+    (header_size,) = struct.unpack_from("<I", body, len(COLUMNS_MAGIC))
+    start = len(COLUMNS_MAGIC) + 4
+    position = start + header_size
+    header = loads(body[start:position])
+
+    layouts = [(track["count"], TRACK_COLUMNS) for track in header["midi"]["tracks"]]
+    layouts += [(score["count"], SCORE_COLUMNS) for score in header["scores"]]
+    columns = []
+    for count, dtypes in layouts:
+        group = {}
+        for name, dtype in dtypes.items():
+            position += -position % ALIGNMENT
+            group[name] = np.frombuffer(body, dtype, count, position)
+            position += dtype.itemsize * count
+        columns.append(group)
+    return join_columns(header, columns)
+
+
+def encode_msgpack(song, dumps=json.dumps):
+    # The columns format's header as MessagePack, every track and score
+    # holding its columns as binary values
+    header, columns = split_columns(song, dumps)
+    groups = header["midi"]["tracks"] + header["scores"]
+    for group, group_columns in zip(groups, columns):
+        group.update((name, column.tobytes()) for name, column in group_columns.items())
+    return msgpack.packb(header)
+
+
+def encode_song(song, mimetype, dumps=json.dumps):
+    if mimetype == COLUMNS:
+        return encode_columns(song, dumps)
+    if mimetype == MSGPACK:
+        return encode_msgpack(song, dumps)
+    return dumps(song).encode()
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
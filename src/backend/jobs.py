@@ -0,0 +1,123 @@
+import multiprocessing
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Optional
+
+from melolib.cache import LRUCache
+
+
+class QueueFull(Exception):
+    ...
+
+
+@dataclass
+class Job:
+    id: str
+    cache_key: str
+    status: str = "queued"
+    result: Optional[bytes] = None
+    error: Optional[str] = None
+    future: Optional[Future] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+    def to_json(self):
+        status = self.status
+        if status == "queued" and self.future is not None and self.future.running():
+            status = "running"
+        json = {"job_id": self.id, "status": status}
+        if self.error is not None:
+            json["error"] = self.error
+        return json
+
+
+class JobQueue:
+    """Runs fn(*args) -> bytes on a local process pool.
+
+    At most max_pending jobs may be queued or running, further submissions
+    raise QueueFull. Results are cached by the caller supplied key, and a job
+    whose key is already cached or in flight reuses that result.
+    """
+
+    def __init__(self, fn, max_workers=2, max_pending=16, max_finished=256):
+        self.fn = fn
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.results = LRUCache(maxsize=max_finished)
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Workers are started on first use, spawned so they don't inherit the
+        # server's threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _add(self, job):
+        self._jobs[job.id] = job
+        finished = [j.id for j in self._jobs.values() if j.done.is_set()]
+        excess = len(finished) - self.max_finished
+        for job_id in finished[:excess] if excess > 0 else []:
+            del self._jobs[job_id]
+
+    def submit(self, cache_key, *args):
+        with self._lock:
+            if cache_key in self._in_flight:
+                return self._in_flight[cache_key]
+
+            job = Job(uuid.uuid4().hex, cache_key)
+            result = self.results.get(cache_key)
+            if result is not None:
+                job.status, job.result = "done", result
+                job.done.set()
+                self._add(job)
+                return job
+
+            if len(self._in_flight) >= self.max_pending:
+                raise QueueFull()
+            self._in_flight[cache_key] = job
+            self._add(job)
+
+        executor = self.executor
+        try:
+            job.future = executor.submit(self.fn, *args)
+        except Exception as e:
+            self._fail(job, executor, e)
+            return job
+        job.future.add_done_callback(lambda future: self._finish(job, future, executor))
+        return job
+
+    def _fail(self, job, executor, error):
+        # A broken pool stays broken, the next submission starts a new one
+        job.status, job.error = "failed", str(error)
+        with self._lock:
+            if isinstance(error, BrokenProcessPool) and self._executor is executor:
+                self._executor = None
+            self._in_flight.pop(job.cache_key, None)
+        job.done.set()
+
+    def _finish(self, job, future, executor):
+        try:
+            job.result = future.result()
+        except Exception as e:
+            self._fail(job, executor, e)
+            return
+        job.status = "done"
+        self.results.put(job.cache_key, job.result)
+        with self._lock:
+            del self._in_flight[job.cache_key]
+        job.done.set()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
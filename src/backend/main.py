@@ -1,16 +1,44 @@
+import functools
+import hashlib
+import io
+import multiprocessing
+import os
 import sys
+import threading
 from flask import Flask, render_template, request
+from flask.json.provider import DefaultJSONProvider
 from pathlib import Path
-import random
 
 sys.path.append("..")
-from melolib.chord_parser import chord_parser
-from melolib.midi import parse_midi
+from backend.encoding import (
+    COLUMNS,
+    ENCODINGS,
+    JSON,
+    best_encoding,
+    best_format,
+    compress,
+    decode_columns,
+    encode_song,
+)
+from backend.jobs import JobQueue, QueueFull
+from melolib.accompaniment import accompaniment_track
+from melolib.cache import LRUCache
+from melolib.midi import TrackNotes, parse_midi
 from melolib.notation import generate_score_from_parsed_midi
 from melolib.wav_to_midi import wav_to_midi
-from trained_models.chord_progression import get_chord_progression_from_key
+from trained_models.progression_bank import get_progression
+
+
+class MelowaveJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, TrackNotes):
+            return o.tolist()
+        return DefaultJSONProvider.default(o)
+
 
 app = Flask(__name__)
+app.json = MelowaveJSONProvider(app)
 
 PROJECT_NAME = "MELOWAVE"
 
@@ -34,6 +62,17 @@ AVAILABLE_SONGS = [
     Path("res/midi/summertime_sadness.mid"),
 ]
 
+# Serialized /song responses, keyed by file identity so edits invalidate them and
+# by format and content encoding. Entries of edited files are never read again,
+# the disk bound evicts them.
+SONG_CACHE = LRUCache(
+    maxsize=4 * len(AVAILABLE_SONGS),
+    directory=Path("out/cache/songs"),
+    max_disk_bytes=64 * 2**20,
+)
+# Encoded job results, keyed by the result's hash, format and content encoding
+JOB_RESPONSE_CACHE = LRUCache(maxsize=64)
+
 
 @app.route("/")
 def index():
@@ -47,10 +86,12 @@ def song_list():
     )
 
 
-@app.get("/song/<int:song_num>")
-def song(song_num):
-    song_num = song_num % len(AVAILABLE_SONGS)
-    song_path = AVAILABLE_SONGS[song_num]
+def song_cache_key(song_path):
+    stat = song_path.stat()
+    return f"{song_path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def load_song(song_path):
     midi = parse_midi(song_path)
     scores = generate_score_from_parsed_midi(midi)
     return {
@@ -60,92 +101,94 @@ def song(song_num):
     }
 
 
-def track_from_chord_progression_full(chord_progression, ticks_per_beat):
-    midi_notes = []
-    num_beats = 0
-    beats_per_chord = 4
-    for _ in range(3):
-        for chord_repr in chord_progression:
-            chord = chord_parser(chord_repr)
-            random.shuffle(chord.notes)
-            for i, note in enumerate(chord.notes):
-                start_tick = int(num_beats * beats_per_chord * ticks_per_beat)
-                end_tick = int(start_tick + ticks_per_beat * beats_per_chord)
-                key, octave = note.get_name()
-                octave = max(2, min(3, octave))
-                midi_notes.append(
-                    {
-                        "note": key,
-                        "octave": octave,
-                        "velocity": 0.4,
-                        "start_tick": start_tick,
-                        "end_tick": end_tick,
-                    }
-                )
-            num_beats += 1
-    return {"name": "Chord progression", "data": midi_notes}
-
-
-def track_from_chord_progression(chord_progression, ticks_per_beat, octaver):
-    midi_notes = []
-    num_beats = 0
-    beats_per_chord = 4
-    for _ in range(3):
-        for chord_repr in chord_progression:
-            chord = chord_parser(chord_repr)
-            chord.notes = chord.notes + chord.notes[::-1]
-            random.shuffle(chord.notes)
-            for i, note in enumerate(chord.notes):
-                if random.random() > 0.65:
-                    continue
-                start_tick = int(
-                    (
-                        num_beats * beats_per_chord
-                        + i * beats_per_chord / len(chord.notes)
-                    )
-                    * ticks_per_beat
-                )
-                end_tick = int(
-                    start_tick
-                    + ticks_per_beat
-                    * (beats_per_chord / len(chord.notes))
-                    * random.randint(1, 4)
-                )
-                key, octave = note.get_name()
-                octave = max(octaver, min(octaver, octave))
-                midi_notes.append(
-                    {
-                        "note": key,
-                        "octave": octave,
-                        "velocity": 0.7,
-                        "start_tick": start_tick,
-                        "end_tick": end_tick,
-                    }
-                )
-            num_beats += 1
-    return {"name": "Melody Line", "data": midi_notes}
+def encoded_song(cache, key, compute_song, mimetype, encoding):
+    # The song body for a representation, cached under it unless cache is None
+    def render():
+        song = compute_song()
+        return compress(encode_song(song, mimetype, app.json.dumps), encoding)
 
+    if cache is None:
+        return render()
+    return cache.get_or_compute(f"{key}:{mimetype}:{encoding}", render)
 
-@app.post("/generate")
-def generate():
-    file = request.files["sample"]
-    tempo = request.form["tempo"]
-    chord_complexity = request.form["chord_complexity"]
 
-    midi = wav_to_midi(file, int(tempo))
-    scores = generate_score_from_parsed_midi(midi)
+def negotiated_response(cache, key, compute_song):
+    """Responds with the song in the best format and content encoding.
 
-    key = scores[0]["key_signature"][0][0]
-    chord_progression = get_chord_progression_from_key(key, chord_complexity)
-    midi["tracks"] = []
+    Cached representations get an ETag derived from key, which must change
+    whenever the song does, and are answered with 304 when it matches.
+    """
+    mimetype = best_format(request.accept_mimetypes)
+    encoding = best_encoding(request.accept_encodings)
+    etag = hashlib.sha256(f"{key}:{mimetype}:{encoding}".encode()).hexdigest()
+    if cache is not None and etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        body = encoded_song(cache, key, compute_song, mimetype, encoding)
+        response = app.response_class(body, mimetype=mimetype)
+        if encoding != "identity":
+            response.content_encoding = encoding
+    if cache is not None:
+        response.set_etag(etag)
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
 
-    midi["tracks"].append(
-        track_from_chord_progression(chord_progression, midi["ticks_per_beat"], 4)
-    )
-    midi["tracks"].append(
-        track_from_chord_progression_full(chord_progression, midi["ticks_per_beat"])
+
+# The representations of browsers, with and without the bundled frontend
+PREWARMED = [(JSON, "identity"), (JSON, ENCODINGS[0]), (COLUMNS, ENCODINGS[0])]
+
+
+def prewarm_song_cache():
+    for song_path in AVAILABLE_SONGS:
+        if song_path.exists():
+            key = song_cache_key(song_path)
+            song = functools.cache(lambda: load_song(song_path))
+            for mimetype, encoding in PREWARMED:
+                encoded_song(SONG_CACHE, key, song, mimetype, encoding)
+
+
+if (
+    os.environ.get("MELOWAVE_PREWARM_SONGS")
+    and multiprocessing.parent_process() is None
+):
+    threading.Thread(target=prewarm_song_cache, daemon=True).start()
+
+
+@app.get("/song/<int:song_num>")
+def song(song_num):
+    song_num = song_num % len(AVAILABLE_SONGS)
+    song_path = AVAILABLE_SONGS[song_num]
+    return negotiated_response(
+        SONG_CACHE, song_cache_key(song_path), lambda: load_song(song_path)
     )
-  
+
+
+# Accompaniment patterns of generated songs, velocities are MIDI velocity / 100
+ARPEGGIO = {"pattern": "arpeggio", "octaves": (4, 4), "velocity": 70}
+BLOCK = {"pattern": "block", "octaves": (2, 3), "velocity": 40}
+
+# Tempo independent pitch tracking results, shared on disk by the job workers
+TRANSCRIPTION_CACHE = LRUCache(
+    maxsize=64,
+    directory=Path("out/cache/transcriptions"),
+    max_disk_bytes=256 * 2**20,
+)
+
+
+def generate_song(sample, tempo, chord_complexity):
+    midi = wav_to_midi(sample, tempo, cache=TRANSCRIPTION_CACHE)
+    scores = generate_score_from_parsed_midi(midi)
+
+    key = scores[0]["key_signature"][0][0]
+    chord_progression = get_progression(key, chord_complexity)
+    midi["tracks"] = [
+        accompaniment_track(
+            "Melody Line", chord_progression, midi["ticks_per_beat"], **ARPEGGIO
+        ),
+        accompaniment_track(
+            "Chord progression", chord_progression, midi["ticks_per_beat"], **BLOCK
+        ),
+    ]
 
     scores = generate_score_from_parsed_midi(midi)  # Regenerate score for added track
     return {
@@ -155,6 +198,85 @@ def generate():
     }
 
 
+def render_generated_song(sample_bytes, tempo, chord_complexity):
+    # Columnar, so results stay small and decode back for any response format
+    song = generate_song(io.BytesIO(sample_bytes), tempo, chord_complexity)
+    return encode_song(song, COLUMNS, app.json.dumps)
+
+
+GENERATE_JOBS = JobQueue(
+    render_generated_song,
+    max_workers=int(os.environ.get("MELOWAVE_JOB_WORKERS", 2)),
+    max_pending=int(os.environ.get("MELOWAVE_JOB_QUEUE_SIZE", 16)),
+)
+
+
+@app.post("/generate")
+def generate():
+    file = request.files["sample"]
+    tempo = int(request.form["tempo"])
+    chord_complexity = request.form["chord_complexity"]
+
+    if request.form.get("mode") != "job":
+        song = generate_song(file, tempo, chord_complexity)
+        return negotiated_response(None, None, lambda: song)
+
+    sample_bytes = file.read()
+    digest = hashlib.sha256(sample_bytes).hexdigest()
+    try:
+        job = GENERATE_JOBS.submit(
+            f"{digest}:{tempo}:{chord_complexity}",
+            sample_bytes,
+            tempo,
+            chord_complexity,
+        )
+    except QueueFull:
+        return {"error": "Too many pending jobs, try again later"}, 429
+    return job.to_json(), 202, {"Location": f"/jobs/{job.id}"}
+
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id):
+    job = GENERATE_JOBS.get(job_id)
+    if job is None:
+        return {"error": "Unknown job"}, 404
+    return job.to_json()
+
+
+@app.get("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = GENERATE_JOBS.get(job_id)
+    if job is None:
+        return {"error": "Unknown job"}, 404
+    if job.result is None:
+        return job.to_json(), 409
+    return negotiated_response(
+        JOB_RESPONSE_CACHE,
+        hashlib.sha256(job.result).hexdigest(),
+        lambda: decode_columns(job.result, app.json.loads),
+    )
+
+
+@app.get("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = GENERATE_JOBS.get(job_id)
+    if job is None:
+        return {"error": "Unknown job"}, 404
+
+    def events():
+        # Server-sent events, one per status change until the job finishes
+        last = None
+        while True:
+            status = job.to_json()
+            if status != last:
+                yield f"data: {app.json.dumps(status)}\n\n"
+                last = status
+            if job.done.wait(0.5) and status["status"] in ("done", "failed"):
+                return
+
+    return app.response_class(events(), mimetype="text/event-stream")
+
+
 @app.get("/test")
 def test():
-    return get_chord_progression_from_key("G", "complex")
+    return get_progression("G", "complex")
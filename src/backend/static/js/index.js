@@ -204,8 +204,8 @@ class PianoScoreRenderer {
     });
     if (duration.endsWith("..")) {
       Vex.Flow.Dot.buildAndAttach([stave_note], { all: true });
-    } else if (duration.endsWith(".")) {
       Vex.Flow.Dot.buildAndAttach([stave_note], { all: true });
+    } else if (duration.endsWith(".")) {
       Vex.Flow.Dot.buildAndAttach([stave_note], { all: true });
     }
 
@@ -240,11 +240,13 @@ class PianoScoreRenderer {
       this.scroll_index += this.num_notes_in_line / 2;
     }
 
-    let notes_ = score.data
-      .slice(this.scroll_index, this.scroll_index + this.num_notes_in_line)
-      .map(({ time, duration, notation }) => {
-        return PianoScoreRenderer.create_stave_note(time, duration, notation);
-      });
+    let visible = score.data.slice(
+      this.scroll_index,
+      this.scroll_index + this.num_notes_in_line
+    );
+    let notes_ = visible.map(({ time, duration, notation }) => {
+      return PianoScoreRenderer.create_stave_note(time, duration, notation);
+    });
 
     var beams = Vex.Flow.Beam.generateBeams(notes_);
     voice.setMode(Vex.Flow.Voice.Mode.SOFT);
@@ -258,6 +260,21 @@ class PianoScoreRenderer {
     for (let beam of beams) {
       beam.setContext(this.context).draw();
     }
+
+    // A tied entry continues into the next one, which holds the same keys
+    for (let [idx, { notation }] of visible.entries()) {
+      if (notation.tie && idx + 1 < notes_.length) {
+        let indices = notation.keys.map((_, key_idx) => key_idx);
+        new Vex.Flow.StaveTie({
+          first_note: notes_[idx],
+          last_note: notes_[idx + 1],
+          first_indices: indices,
+          last_indices: indices,
+        })
+          .setContext(this.context)
+          .draw();
+      }
+    }
   }
 
   render() {
@@ -271,6 +288,90 @@ class PianoScoreRenderer {
   }
 }
 
+// Compact song encoding served by the backend, see backend/encoding.py. Typed
+// arrays use the platform byte order, which is little endian in browsers.
+const SONG_FORMAT = "application/vnd.melowave.columns";
+const NOTE_NAMES = [
+  "C",
+  "C#",
+  "D",
+  "D#",
+  "E",
+  "F",
+  "F#",
+  "G",
+  "G#",
+  "A",
+  "A#",
+  "B",
+];
+const TRACK_COLUMNS = [
+  ["start_tick", Uint32Array],
+  ["end_tick", Uint32Array],
+  ["pitch", Uint8Array],
+  ["velocity", Uint8Array],
+];
+const SCORE_COLUMNS = [
+  ["start_tick", Uint32Array],
+  ["end_tick", Uint32Array],
+  ["notation", Uint32Array],
+];
+
+function decode_columns(buffer) {
+  let decoder = new TextDecoder();
+  if (decoder.decode(new Uint8Array(buffer, 0, 4)) !== "MWC1") {
+    throw new Error("Not a columnar song");
+  }
+  let header_size = new DataView(buffer).getUint32(4, true);
+  let song = JSON.parse(decoder.decode(new Uint8Array(buffer, 8, header_size)));
+
+  let position = 8 + header_size;
+  let read_columns = (count, layout) => {
+    let columns = {};
+    for (let [name, type] of layout) {
+      position += (4 - (position % 4)) % 4;
+      columns[name] = new type(buffer, position, count);
+      position += type.BYTES_PER_ELEMENT * count;
+    }
+    return columns;
+  };
+
+  song.midi.tracks = song.midi.tracks.map(({ name, count }) => {
+    let { start_tick, end_tick, pitch, velocity } = read_columns(
+      count,
+      TRACK_COLUMNS,
+    );
+    let data = Array.from({ length: count }, (_, i) => ({
+      note: NOTE_NAMES[pitch[i] % 12],
+      octave: Math.floor(pitch[i] / 12) - 1,
+      velocity: velocity[i] / 100,
+      start_tick: start_tick[i],
+      end_tick: end_tick[i],
+    }));
+    return { name, data };
+  });
+  song.scores = song.scores.map(({ count, notations, ...score }) => {
+    let { start_tick, end_tick, notation } = read_columns(count, SCORE_COLUMNS);
+    let data = Array.from({ length: count }, (_, i) => ({
+      start_tick: start_tick[i],
+      end_tick: end_tick[i],
+      notation: notations[notation[i]],
+    }));
+    return { ...score, data };
+  });
+  return song;
+}
+
+async function fetch_song(url) {
+  let response = await fetch(url, {
+    headers: { Accept: `${SONG_FORMAT}, application/json;q=0.9` },
+  });
+  if (response.headers.get("Content-Type")?.startsWith(SONG_FORMAT)) {
+    return decode_columns(await response.arrayBuffer());
+  }
+  return response.json();
+}
+
 function setup_controls() {
   // Song selector
   fetch("/song_list").then(async (response) => {
@@ -416,8 +517,8 @@ function on_track_update() {}
 function load() {
   let selected_song =
     document.getElementById("sample-songs").selectedOptions[0].value;
-  fetch(`/song/${selected_song}`).then(async (response) => {
-    update_song(await response.json());
+  fetch_song(`/song/${selected_song}`).then((song) => {
+    update_song(song);
     on_update_song();
   });
 }
@@ -431,12 +532,26 @@ function generate() {
   formData.append("sample", sampleFile);
   formData.append("tempo", tempoValue);
   formData.append("chord_complexity", chordComplexity);
+  formData.append("mode", "job");
 
   fetch("/generate", {
     method: "POST",
     body: formData,
   }).then(async (response) => {
-    update_song(await response.json());
+    if (response.status === 429) {
+      alert("The server is busy, please try again in a moment.");
+      return;
+    }
+    let job = await response.json();
+    while (job.status !== "done" && job.status !== "failed") {
+      await new Promise((resolve) => setTimeout(resolve, 500));
+      job = await (await fetch(`/jobs/${job.job_id}`)).json();
+    }
+    if (job.status === "failed") {
+      alert(`Generation failed: ${job.error}`);
+      return;
+    }
+    update_song(await fetch_song(`/jobs/${job.job_id}/result`));
     on_update_song();
   });
 }
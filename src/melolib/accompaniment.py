@@ -0,0 +1,113 @@
+import numpy as np
+
+from .chord_parser import chord_parser
+from .midi import NOTE_DTYPE, TrackNotes
+
+BEATS_PER_CHORD = 4
+REPEATS = 3
+
+PATTERNS = {}
+
+
+def pattern(name):
+    """Registers a pattern function under name for render_accompaniment.
+
+    A pattern takes a (chords, notes) array of pitches, the number of notes
+    of each chord and a numpy Generator. It returns the chord index, pitch,
+    start and length of every event, the last two as fractions of a chord.
+    """
+
+    def register(function):
+        PATTERNS[name] = function
+        return function
+
+    return register
+
+
+@pattern("block")
+def block(pitches, sizes, rng):
+    # Every note of the chord held for the whole chord
+    rows, columns = np.nonzero(np.arange(pitches.shape[1]) < sizes[:, None])
+    return rows, pitches[rows, columns], np.zeros(len(rows)), np.ones(len(rows))
+
+
+@pattern("arpeggio")
+def arpeggio(pitches, sizes, rng, keep=0.65, max_hold=4):
+    # The chord up and back down in a random order, in as many equal steps,
+    # skipping steps with probability 1 - keep and holding for 1 to max_hold
+    steps = 2 * sizes[:, None]
+    columns = np.arange(2 * pitches.shape[1])
+    valid = columns < steps
+    columns = np.where(columns < sizes[:, None], columns, steps - 1 - columns)
+    order = np.argsort(np.where(valid, rng.random(valid.shape), np.inf), axis=1)
+    shuffled = np.take_along_axis(np.where(valid, columns, 0), order, axis=1)
+    played = valid & (rng.random(valid.shape) <= keep)
+    holds = rng.integers(1, max_hold + 1, valid.shape)
+
+    rows, slots = np.nonzero(played)
+    steps = steps[:, 0][rows]
+    return (
+        rows,
+        pitches[rows, shuffled[rows, slots]],
+        slots / steps,
+        holds[rows, slots] / steps,
+    )
+
+
+def voice_progression(chord_progression, octaves=(4, 4)):
+    """Parses every chord once into a (chords, notes) array of MIDI pitches.
+
+    Note octaves are clamped to the inclusive octaves range, returns the
+    pitches, padded with -1, and the number of notes of each chord.
+    """
+    voicings = [
+        [note.note for note in chord_parser(chord).notes] for chord in chord_progression
+    ]
+    sizes = np.array([len(voicing) for voicing in voicings], dtype=np.int64)
+    notes = np.full((len(voicings), max(sizes, default=0)), -1, dtype=np.int64)
+    notes[np.arange(notes.shape[1]) < sizes[:, None]] = [
+        note for voicing in voicings for note in voicing
+    ]
+    octaves = np.clip(notes // 12, *octaves)
+    pitches = np.where(notes < 0, -1, notes % 12 + (octaves + 1) * 12)
+    return pitches, sizes
+
+
+def render_accompaniment(
+    chord_progression,
+    ticks_per_beat,
+    pattern="arpeggio",
+    repeats=REPEATS,
+    beats_per_chord=BEATS_PER_CHORD,
+    octaves=(4, 4),
+    velocity=70,
+    rng=None,
+    **options,
+):
+    """Plays chord_progression repeats times with a registered pattern.
+
+    Returns a NOTE_DTYPE array sorted by start tick. rng is a numpy
+    Generator or seed, the same seed renders the same notes. options are
+    passed on to the pattern function.
+    """
+    rng = np.random.default_rng(rng)
+    pitches, sizes = voice_progression(chord_progression, octaves)
+    pitches, sizes = np.tile(pitches, (repeats, 1)), np.tile(sizes, repeats)
+    rows, event_pitches, starts, lengths = PATTERNS[pattern](
+        pitches, sizes, rng, **options
+    )
+
+    chord_ticks = beats_per_chord * ticks_per_beat
+    notes = np.empty(len(rows), dtype=NOTE_DTYPE)
+    notes["pitch"] = event_pitches
+    notes["velocity"] = velocity
+    notes["start_tick"] = (rows + starts) * chord_ticks
+    notes["end_tick"] = notes["start_tick"] + (lengths * chord_ticks).astype(np.int64)
+    notes["channel"] = 0
+    return notes[np.argsort(notes["start_tick"], kind="stable")]
+
+
+def accompaniment_track(name, chord_progression, ticks_per_beat, **options):
+    # render_accompaniment as a parse_midi style track
+    notes = render_accompaniment(chord_progression, ticks_per_beat, **options)
+    return {"name": name, "data": TrackNotes(notes)}
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class LRUCache:
+    """Thread-safe LRU cache of bytes values with an optional on-disk store.
+
+    Entries evicted from memory stay in the directory (if given) and are loaded
+    back on the next miss, so the store also survives restarts. Without
+    max_disk_bytes the directory grows unbounded, with it every put deletes the
+    least recently used files until the directory fits.
+    """
+
+    def __init__(self, maxsize=128, directory=None, max_disk_bytes=None):
+        self.maxsize = maxsize
+        self.directory = Path(directory) if directory is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.directory / hashlib.sha256(key.encode()).hexdigest()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            value = path.read_bytes()
+            os.utime(path)  # Marks the file as recently used for _prune_disk
+        except FileNotFoundError:
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory is None:
+            return
+        # Created on the first spill, so constructing a cache writes nothing
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, self._path(key))
+        if self.max_disk_bytes is not None:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        # Other processes may share the directory, so files can vanish anytime
+        files = []
+        for path in self.directory.iterdir():
+            if len(path.name) != 64:  # Another put's temporary file
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+        files.sort()
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in files:
+            if size <= self.max_disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= file_size
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,3 +1,4 @@
+import functools
 import re
 
 from .music import Chord, Note
@@ -14,16 +15,23 @@ TOKENS = {
 }
 
 ALL_TOKENS = sum([t for t in TOKENS.values()], [])
+TOKEN_TYPES = {value: key for key, values in TOKENS.items() for value in values}
+
+# Combined pattern for all token types, compiled once
+TOKEN_PATTERN = re.compile(
+    "|".join(f"(?P<{name}>{'|'.join(values)})" for name, values in TOKENS.items())
+)
+
+# Chord symbols in the datasets repeat heavily, a few hundred distinct strings
+# cover nearly all of them
+CHORD_CACHE_SIZE = 4096
 
 
 class Token:
     def __init__(self, value):
-        if value not in ALL_TOKENS:
+        if value not in TOKEN_TYPES:
             raise ValueError(f"Invalid token: {value}")
-
-        for key, val in TOKENS.items():
-            if value in val:
-                self.type = key
+        self.type = TOKEN_TYPES[value]
         self.value = value
 
     def __repr__(self):
@@ -31,26 +39,7 @@ class Token:
 
 
 def lexer(input_string):
-    # Define regular expressions for each token type
-    patterns = {
-        "note_name": "|".join(TOKENS["note_name"]),
-        "note_accidentals": "|".join(TOKENS["note_accidentals"]),
-        "chord_type": "|".join(TOKENS["chord_type"]),
-        "separators": "|".join(TOKENS["separators"]),
-        "unknown": "|".join(TOKENS["unknown"]),
-    }
-
-    # Combined pattern for all token types
-    combined_pattern = "|".join(
-        f"(?P<{name}>{pattern})" for name, pattern in patterns.items()
-    )
-    tokens = []
-    for match in re.finditer(combined_pattern, input_string):
-        for name, _ in patterns.items():
-            if match.group(name):
-                tokens.append(Token(match.group()))
-                break
-    return tokens
+    return [Token(match.group()) for match in TOKEN_PATTERN.finditer(input_string)]
 
 
 def chord_parser_raw(chord_notation):
@@ -72,6 +61,8 @@ def chord_parser_raw(chord_notation):
                 raise ValueError(f"Invalid chord notation: {chord_notation}")
         elif token.type == "note_accidentals":
             if separator_encountered:
+                if over_note is None:
+                    raise ValueError(f"Invalid chord notation: {chord_notation}")
                 over_note += token.value
             elif root_note is not None:
                 root_note += token.value
@@ -95,6 +86,30 @@ def chord_parser_raw(chord_notation):
     return root_note, chord_type
 
 
+@functools.lru_cache(maxsize=CHORD_CACHE_SIZE)
+def _parse(chord_notation):
+    # Failures are cached as messages so repeated junk words stay cheap too
+    try:
+        root_note, chord_type = chord_parser_raw(chord_notation)
+        return Chord.from_name(root_note, chord_type), None
+    except ValueError as e:
+        return None, str(e)
+
+
 def chord_parser(chord_notation):
-    root_note, chord_type = chord_parser_raw(chord_notation)
-    return Chord.from_name(root_note, chord_type)
+    chord, error = _parse(chord_notation)
+    if error is not None:
+        raise ValueError(error)
+    return chord
+
+
+def parse_many(chord_notations):
+    """Parses every notation, returning a list of (chord, error) pairs.
+
+    Exactly one of the pair is None, so a bad symbol never aborts the batch.
+    """
+    return [_parse(chord_notation) for chord_notation in chord_notations]
+
+
+chord_parser_cache_info = _parse.cache_info
+chord_parser_cache_clear = _parse.cache_clear
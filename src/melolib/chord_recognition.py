@@ -0,0 +1,153 @@
+from functools import lru_cache
+
+import numpy as np
+
+from .keys import PITCH_CLASS_INDEX
+from .midi import TrackNotes
+from .music import Chord, Note
+
+NUM_MASKS = 1 << 12
+
+# Every chord type under every root, in chord_types order and then by root
+SHAPE_TYPES = [t for t in Chord.chord_types.values() for _ in range(12)]
+SHAPE_ROOTS = [root for _ in Chord.chord_types for root in range(12)]
+
+
+def rotate_mask(mask, semitones):
+    semitones %= 12
+    return ((mask << semitones) | (mask >> (12 - semitones))) & (NUM_MASKS - 1)
+
+
+def pitch_class_mask(pitches):
+    mask = 0
+    for pitch in pitches:
+        mask |= 1 << (pitch % 12)
+    return mask
+
+
+@lru_cache
+def chord_table():
+    """(4096, 12, 12) array of the best shape for every mask, bass and lowest
+    other pitch class.
+
+    A shape scores the notes it shares with the mask minus the ones it misses
+    and the ones it doesn't explain. Ties between the best shapes go to one
+    rooted on the bass, then one rooted on the lowest other note, then the
+    first in chord_types order. -1 marks masks no shape explains better than
+    it misses.
+    """
+    masks = np.arange(NUM_MASKS)
+    shapes = np.array(
+        [
+            rotate_mask(Chord.chord_type_masks[t], root)
+            for t, root in zip(SHAPE_TYPES, SHAPE_ROOTS)
+        ]
+    )
+    popcount = np.array([bin(mask).count("1") for mask in masks])
+    scores = (
+        3 * popcount[masks[:, None] & shapes[None, :]]
+        - popcount[shapes][None, :]
+        - popcount[masks][:, None]
+    )
+    best = scores == scores.max(axis=1, keepdims=True)
+
+    # The first best shape on every root, and whether there is one
+    roots = np.array(SHAPE_ROOTS)
+    on_root = best[:, None, :] & (roots == np.arange(12)[:, None])
+    has_root, root_shape = on_root.any(axis=2), on_root.argmax(axis=2)
+    on_lowest = np.where(
+        has_root[:, None, :], root_shape[:, None, :], best.argmax(axis=1)[:, None, None]
+    )
+    table = np.where(has_root[:, :, None], root_shape[:, :, None], on_lowest)
+    table[(scores.max(axis=1) <= 0) | (popcount < 2)] = -1
+    return table.astype(np.int16)
+
+
+@lru_cache
+def label_names():
+    # Object array of names indexed by shape * 12 + bass, None at the end for -1
+    names = []
+    for chord_type, root in zip(SHAPE_TYPES, SHAPE_ROOTS):
+        name = Note.chromatic_sharps[root] + chord_type
+        for bass in range(12):
+            if bass == root:
+                names.append(name)
+            else:
+                names.append(f"{name}/{Note.chromatic_sharps[bass]}")
+    names.append(None)
+    return np.array(names, dtype=object)
+
+
+def recognize_mask(mask, bass, lowest=None):
+    # Name of the chord with pitch class mask over bass pitch class, or None.
+    # lowest is the pitch class of the lowest note above the bass, if known.
+    lowest = bass if lowest is None else lowest
+    shape = int(chord_table()[mask, bass % 12, lowest % 12])
+    if shape < 0:
+        return None
+    return label_names()[shape * 12 + bass % 12]
+
+
+def recognize(notes):
+    """Names any set of Notes or MIDI numbers, e.g. "C", "Am7/G" or None.
+
+    Inversions and voicings are named after their root with the lowest note
+    as a slash bass, extra or missing notes get the closest chord type. Of
+    chords with the same notes, like Am7 and C6, the one rooted on the bass
+    wins, then the one rooted on the lowest note above it.
+    """
+    pitches = [note.note if isinstance(note, Note) else note for note in notes]
+    if not pitches:
+        return None
+    bass = min(pitches)
+    above = [pitch for pitch in pitches if (pitch - bass) % 12]
+    lowest = min(above) if above else bass
+    return recognize_mask(pitch_class_mask(pitches), bass, lowest)
+
+
+def onset_groups(notes):
+    # Start ticks, pitch class masks, lowest pitches and lowest pitches of
+    # another pitch class of notes sharing onsets
+    order = np.argsort(notes["start_tick"], kind="stable")
+    starts = notes["start_tick"][order]
+    pitches = notes["pitch"][order].astype(np.int64)
+    if len(starts) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    first = np.flatnonzero(np.diff(starts, prepend=starts[0] - 1))
+    masks = np.bitwise_or.reduceat(1 << (pitches % 12), first)
+    basses = np.minimum.reduceat(pitches, first)
+    group_basses = np.repeat(basses, np.diff(first, append=len(pitches)))
+    above = np.where(
+        (pitches - group_basses) % 12 != 0, pitches, np.iinfo(np.int64).max
+    )
+    lowest = np.minimum.reduceat(above, first)
+    lowest = np.where(lowest == np.iinfo(np.int64).max, basses, lowest)
+    return starts[first], masks, basses, lowest
+
+
+def label_onset_groups(notes):
+    """Labels every group of notes starting together, all groups at once.
+
+    notes is a NOTE_DTYPE array, returns the group start ticks and an object
+    array of chord names with None for groups that aren't chords.
+    """
+    starts, masks, basses, lowest = onset_groups(notes)
+    shapes = chord_table()[masks, basses % 12, lowest % 12].astype(np.int64)
+    labels = np.where(shapes < 0, -1, shapes * 12 + basses % 12)
+    return starts, label_names()[labels]
+
+
+def label_track(track_data):
+    # label_onset_groups for a TrackNotes view or parse_midi style note dicts
+    if isinstance(track_data, TrackNotes):
+        return label_onset_groups(track_data.notes)
+    notes = np.empty(
+        len(track_data), dtype=[("pitch", np.int64), ("start_tick", np.int64)]
+    )
+    notes["pitch"] = [
+        PITCH_CLASS_INDEX[note["note"]] + (note["octave"] + 1) * 12
+        for note in track_data
+    ]
+    notes["start_tick"] = [note["start_tick"] for note in track_data]
+    return label_onset_groups(notes)
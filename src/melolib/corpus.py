@@ -0,0 +1,112 @@
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+VOCAB_FILE = "vocab.json"
+TOKENS_FILE = "tokens.npy"
+OFFSETS_FILE = "offsets.npy"
+COMPLEXITY_FILE = "complexity.npy"
+
+
+@dataclass(frozen=True)
+class ChordCorpus:
+    """Chord progressions as integer tokens into a shared vocabulary.
+
+    Song i is tokens[offsets[i]:offsets[i + 1]] and has the complexity
+    features complexity[i], of which there may be none. Loaded corpora are
+    memory mapped, so nothing is read until it is used.
+    """
+
+    vocab: list
+    tokens: np.ndarray
+    offsets: np.ndarray
+    complexity: np.ndarray
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def song_ids(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.tokens[start:end]
+
+    def song(self, idx):
+        return [self.vocab[token] for token in self.song_ids(idx).tolist()]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.song(idx)
+
+
+def token_dtype(vocab_size):
+    return np.int16 if vocab_size <= np.iinfo(np.int16).max else np.int32
+
+
+def build_corpus(songs, complexities=None, vocab=None):
+    # In memory corpus of chord name lists, vocab defaults to the sorted chords
+    songs = list(songs)
+    if vocab is None:
+        vocab = sorted({chord for song in songs for chord in song})
+    ids = {chord: i for i, chord in enumerate(vocab)}
+    tokens = np.fromiter(
+        (ids[chord] for song in songs for chord in song), dtype=token_dtype(len(vocab))
+    )
+    offsets = np.cumsum([0] + [len(song) for song in songs], dtype=np.int64)
+    if complexities is None:
+        complexity = np.empty((len(songs), 0), dtype=np.float32)
+    else:
+        complexity = np.asarray(complexities, dtype=np.float32).reshape(len(songs), -1)
+    return ChordCorpus(list(vocab), tokens, offsets, complexity)
+
+
+def save_corpus(corpus, directory):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / VOCAB_FILE, "w") as f:
+        json.dump({"chords": corpus.vocab}, f)
+    np.save(directory / TOKENS_FILE, corpus.tokens)
+    np.save(directory / OFFSETS_FILE, corpus.offsets)
+    np.save(directory / COMPLEXITY_FILE, corpus.complexity)
+
+
+def load_corpus(directory):
+    directory = Path(directory)
+    with open(directory / VOCAB_FILE) as f:
+        vocab = json.load(f)["chords"]
+    return ChordCorpus(
+        vocab,
+        np.load(directory / TOKENS_FILE, mmap_mode="r"),
+        np.load(directory / OFFSETS_FILE, mmap_mode="r"),
+        np.load(directory / COMPLEXITY_FILE, mmap_mode="r"),
+    )
+
+
+def corpus_from_json(json_path):
+    """Reads a progressions json, a list of chord lists or of [complexity,
+    chords] pairs as in chord_progressions_augmented.json.
+    """
+    with open(json_path, encoding="utf8") as f:
+        songs = json.load(f)
+    if songs and len(songs[0]) == 2 and isinstance(songs[0][1], list):
+        complexities, songs = zip(*songs)
+        return build_corpus(songs, complexities)
+    return build_corpus(songs)
+
+
+def corpus_to_json(corpus, json_path):
+    with open(json_path, "w", encoding="utf8") as f:
+        if corpus.complexity.shape[1] == 0:
+            json.dump(list(corpus), f)
+        else:
+            json.dump(list(zip(corpus.complexity.tolist(), corpus)), f)
+
+
+def load_progressions(path):
+    # A corpus directory, or a json file to read into a corpus
+    if Path(path).is_dir():
+        return load_corpus(path)
+    return corpus_from_json(path)
@@ -0,0 +1,147 @@
+from collections import deque
+
+import numpy as np
+
+from .music import Note
+
+PITCH_CLASSES = Note.chromatic_sharps
+PITCH_CLASS_INDEX = {name: i for i, name in enumerate(PITCH_CLASSES)}
+PITCH_CLASS_INDEX.update({name: i for i, name in enumerate(Note.chromatic_flats)})
+
+MAJOR_SCALE = (0, 2, 4, 5, 7, 9, 11)
+HARMONIC_MINOR_SCALE = (0, 2, 3, 5, 7, 8, 11)
+
+# The order ties between equally good keys have always been broken in
+MAJOR_KEYS = ["G#", "D#", "A#", "F", "C", "G", "D", "A", "E", "B", "F#", "C#"]
+MINOR_KEYS = [key + "m" for key in MAJOR_KEYS]
+KEYS = MAJOR_KEYS + MINOR_KEYS
+
+
+def _key_profiles():
+    # profiles[pc, key] is 1 when pitch class pc is outside the key's scale
+    profiles = np.ones((len(PITCH_CLASSES), len(KEYS)), dtype=np.int64)
+    for column, key in enumerate(KEYS):
+        scale = MAJOR_SCALE if column < len(MAJOR_KEYS) else HARMONIC_MINOR_SCALE
+        root = PITCH_CLASS_INDEX[MAJOR_KEYS[column % len(MAJOR_KEYS)]]
+        profiles[[(root + step) % 12 for step in scale], column] = 0
+    return profiles
+
+
+KEY_PROFILES = _key_profiles()
+KEY_PROFILES.flags.writeable = False
+
+
+def pitch_class_histogram(pitch_classes, durations=None):
+    # 12 bin count of the pitch classes, or their total durations if given
+    return np.bincount(pitch_classes, weights=durations, minlength=12)
+
+
+def pitch_class_histograms(pitch_classes, track_ids, num_tracks, durations=None):
+    # One histogram row per track for notes of many tracks at once
+    bins = np.asarray(track_ids) * 12 + np.asarray(pitch_classes)
+    counts = np.bincount(bins, weights=durations, minlength=num_tracks * 12)
+    return counts.reshape(num_tracks, 12)
+
+
+def key_errors(histograms, minor=False):
+    """Weight of the notes outside every key, histograms is (..., 12).
+
+    The last axis of the result follows KEYS, major keys only unless minor.
+    """
+    profiles = KEY_PROFILES if minor else KEY_PROFILES[:, : len(MAJOR_KEYS)]
+    return np.asarray(histograms) @ profiles
+
+
+def estimate_keys(histograms, top=3, minor=False):
+    # The top (key, error) pairs of every histogram row, fewest errors first
+    errors = np.atleast_2d(key_errors(histograms, minor))
+    best = np.argsort(errors, axis=1, kind="stable")[:, :top]
+    best_errors = np.take_along_axis(errors, best, axis=1)
+    return [
+        tuple((KEYS[key], error) for key, error in zip(keys, row_errors))
+        for keys, row_errors in zip(best.tolist(), best_errors.tolist())
+    ]
+
+
+class KeyTracker:
+    """Key estimate over a sliding window of the most recent note onsets.
+
+    Notes are added in onset order and dropped once they leave the window,
+    each only adding or subtracting its profile row from the key errors.
+    """
+
+    def __init__(self, window, minor=False, min_notes=8):
+        self.window = window
+        self.min_notes = min_notes
+        self.profiles = KEY_PROFILES if minor else KEY_PROFILES[:, : len(MAJOR_KEYS)]
+        self.errors = np.zeros(self.profiles.shape[1])
+        self.notes = deque()
+
+    def add(self, time, pitch_class, weight=1):
+        self.notes.append((time, pitch_class, weight))
+        self.errors += weight * self.profiles[pitch_class]
+
+    def advance(self, time):
+        # Drops the notes with onsets before time - window
+        while self.notes and self.notes[0][0] < time - self.window:
+            _, pitch_class, weight = self.notes.popleft()
+            self.errors -= weight * self.profiles[pitch_class]
+
+    def key(self, previous=None):
+        """The key with the fewest errors, None if there are no notes.
+
+        previous is kept while it ties for the fewest errors. Other ties are
+        only broken once the window holds min_notes notes, until then the
+        key stays previous.
+        """
+        if not self.notes:
+            return None
+        best = int(np.argmin(self.errors))
+        if (
+            previous is not None
+            and self.errors[KEYS.index(previous)] == self.errors[best]
+        ):
+            return previous
+        if np.count_nonzero(self.errors == self.errors[best]) == 1:
+            return KEYS[best]
+        return KEYS[best] if len(self.notes) >= self.min_notes else previous
+
+
+def key_series(
+    notes,
+    ticks_per_beat,
+    window_beats=8,
+    hop_beats=1,
+    minor=False,
+    weighted=False,
+    min_notes=8,
+):
+    """Local keys of a parse_midi style track sorted by start_tick.
+
+    Every hop_beats the key of the notes starting in the last window_beats is
+    estimated, weighted by duration if weighted. Returns (start_tick, key)
+    pairs for every change of key, key is None where no notes sound. Ties
+    keep the previous key, see KeyTracker.key, and the first key after a
+    silence starts where its notes do.
+    """
+    tracker = KeyTracker(window_beats * ticks_per_beat, minor, min_notes)
+    hop = hop_beats * ticks_per_beat
+    notes = iter(notes)
+    note = next(notes, None)
+    series = []
+    tick = start = 0
+    while note is not None:
+        if not tracker.notes:
+            tick = start = max(tick, note["start_tick"] // hop * hop)  # Skip silence
+        while note is not None and note["start_tick"] < tick + hop:
+            weight = note["end_tick"] - note["start_tick"] if weighted else 1
+            tracker.add(note["start_tick"], PITCH_CLASS_INDEX[note["note"]], weight)
+            note = next(notes, None)
+        tracker.advance(tick + hop)
+        previous = series[-1][1] if series else None
+        key = tracker.key(previous)
+        # Windows too ambiguous for a first key are given the one they lead to
+        if key != previous and (key is not None or not tracker.notes):
+            series.append((start if previous is None else tick, key))
+        tick += hop
+    return series
@@ -1,4 +1,26 @@
+import mmap
+import struct
+from array import array
+from collections.abc import Sequence
+
 import mido
+import numpy as np
+
+from .music import Note
+
+NOTE_DTYPE = np.dtype(
+    [
+        ("pitch", np.uint8),
+        ("velocity", np.uint8),
+        ("start_tick", np.int64),
+        ("end_tick", np.int64),
+        ("channel", np.uint8),
+    ]
+)
+
+# Data bytes following a status byte, indexed by the status high nibble
+CHANNEL_MESSAGE_SIZES = {0x8: 2, 0x9: 2, 0xA: 2, 0xB: 2, 0xC: 1, 0xD: 1, 0xE: 2}
+SYSTEM_MESSAGE_SIZES = {0xF1: 1, 0xF2: 2, 0xF3: 1}
 
 
 def parse_midi(midi_file_path):
@@ -46,20 +68,187 @@ def parse_midi(midi_file_path):
 
 
 def convert_midi_to_note_octave(note_number):
-    notes_mapping = {
-        0: "C",
-        1: "C#",
-        2: "D",
-        3: "D#",
-        4: "E",
-        5: "F",
-        6: "F#",
-        7: "G",
-        8: "G#",
-        9: "A",
-        10: "A#",
-        11: "B",
-    }
-    note = notes_mapping[note_number % 12]
+    note = Note.chromatic_sharps[note_number % 12]
     octave = note_number // 12 - 1
     return note, octave
+
+
+class TrackNotes(Sequence):
+    """Read-only view presenting columnar notes in the parse_midi dict format."""
+
+    def __init__(self, notes):
+        self.notes = notes
+
+    def __len__(self):
+        return len(self.notes)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return TrackNotes(self.notes[idx])
+        pitch, velocity, start_tick, end_tick, _ = self.notes[idx].tolist()
+        note, octave = convert_midi_to_note_octave(pitch)
+        return {
+            "note": note,
+            "octave": octave,
+            "velocity": velocity / 100,
+            "start_tick": start_tick,
+            "end_tick": end_tick,
+        }
+
+    def __iter__(self):
+        for pitch, velocity, start_tick, end_tick, _ in self.notes.tolist():
+            note, octave = convert_midi_to_note_octave(pitch)
+            yield {
+                "note": note,
+                "octave": octave,
+                "velocity": velocity / 100,
+                "start_tick": start_tick,
+                "end_tick": end_tick,
+            }
+
+    def tolist(self):
+        return list(self)
+
+
+def notes_from_dicts(track_data):
+    """NOTE_DTYPE array of parse_midi style note dicts, the inverse of TrackNotes."""
+    if isinstance(track_data, TrackNotes):
+        return track_data.notes
+    notes = np.zeros(len(track_data), dtype=NOTE_DTYPE)
+    notes["pitch"] = [
+        Note.name_index[note["note"]] + (note["octave"] + 1) * 12 for note in track_data
+    ]
+    notes["velocity"] = [round(note["velocity"] * 100) for note in track_data]
+    notes["start_tick"] = [note["start_tick"] for note in track_data]
+    notes["end_tick"] = [note["end_tick"] for note in track_data]
+    return notes
+
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def _read_track_events(data, pos, end):
+    # Only note events are kept, everything else is skipped over in place
+    ticks, kinds, channels, notes, velocities = (array("q") for _ in range(5))
+    name = None
+    tick = 0
+    last_status = None
+    while pos < end:
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        status = data[pos]
+        if status < 0x80:
+            if last_status is None:
+                raise ValueError("Running status without last status")
+            status = last_status
+        else:
+            pos += 1
+            if status != 0xFF:  # Meta messages don't set running status
+                last_status = status
+
+        if status == 0xFF:
+            meta_type = data[pos]
+            length, pos = _read_varlen(data, pos + 1)
+            meta_end = pos + length
+            if meta_type == 0x03 and name is None:
+                name = data[pos:meta_end].decode("latin1")
+            pos = meta_end
+        elif status == 0xF0 or status == 0xF7:
+            length, pos = _read_varlen(data, pos)
+            pos += length
+        elif status >= 0xF0:
+            pos += SYSTEM_MESSAGE_SIZES.get(status, 0)
+        else:
+            kind = status >> 4
+            if kind == 0x8 or kind == 0x9:
+                ticks.append(tick)
+                # A note_on with zero velocity is a note_off
+                kinds.append(kind == 0x9 and data[pos + 1] != 0)
+                channels.append(status & 0x0F)
+                notes.append(data[pos])
+                velocities.append(data[pos + 1])
+            pos += CHANNEL_MESSAGE_SIZES[kind]
+
+    events = tuple(np.frombuffer(a, dtype=np.int64) for a in (ticks, kinds))
+    events += tuple(
+        np.frombuffer(a, dtype=np.int64).astype(np.uint8)
+        for a in (channels, notes, velocities)
+    )
+    return name or "", events
+
+
+def _pair_note_events(ticks, is_on, channels, pitches, velocities):
+    # Every note_off closes the latest earlier note_on of the same channel and
+    # pitch, matching parse_midi (which never forgets a started note)
+    is_on = is_on.astype(bool)
+    order = np.lexsort(
+        (np.arange(len(ticks)), channels.astype(np.int64) * 128 + pitches)
+    )
+    keys = (channels.astype(np.int64) * 128 + pitches)[order]
+    sorted_on = is_on[order]
+    positions = np.arange(len(order))
+    group_start = np.ones(len(order), dtype=bool)
+    group_start[1:] = keys[1:] != keys[:-1]
+    first_in_group = np.maximum.accumulate(np.where(group_start, positions, 0))
+    last_on = np.maximum.accumulate(np.where(sorted_on, positions, -1))
+    matched = ~sorted_on & (last_on >= first_in_group)
+
+    off_events = order[positions[matched]]
+    on_events = order[last_on[matched]]
+    emitted = np.argsort(off_events, kind="stable")
+    off_events, on_events = off_events[emitted], on_events[emitted]
+
+    notes = np.empty(len(off_events), dtype=NOTE_DTYPE)
+    notes["pitch"] = pitches[on_events]
+    notes["velocity"] = velocities[on_events]
+    notes["start_tick"] = ticks[on_events]
+    notes["end_tick"] = ticks[off_events]
+    notes["channel"] = channels[on_events]
+    return notes
+
+
+def parse_midi_columnar(midi_file_path):
+    """Parses a MIDI file into one structured NOTE_DTYPE array per track.
+
+    The chunks are read straight from a memory-mapped file without building
+    mido messages. Tracks without notes are dropped, as in parse_midi.
+    """
+    with open(midi_file_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        if data[:4] != b"MThd":
+            raise ValueError(f"Not a MIDI file: {midi_file_path}")
+        header_size, _, _, ticks_per_beat = struct.unpack_from(">IHHH", data, 4)
+        pos = 8 + header_size
+
+        track_list = []
+        while pos + 8 <= len(data):
+            chunk_type, chunk_size = struct.unpack_from(">4sI", data, pos)
+            pos += 8
+            end = min(pos + chunk_size, len(data))
+            if chunk_type == b"MTrk":
+                name, events = _read_track_events(data, pos, end)
+                notes = _pair_note_events(*events)
+                if len(notes) != 0:
+                    track_list.append({"name": name, "notes": notes})
+            pos = end
+
+    return {"ticks_per_beat": ticks_per_beat, "tracks": track_list}
+
+
+def columnar_to_dicts(parsed):
+    """Presents a parse_midi_columnar result in the parse_midi format."""
+    return {
+        "ticks_per_beat": parsed["ticks_per_beat"],
+        "tracks": [
+            {"name": track["name"], "data": TrackNotes(track["notes"])}
+            for track in parsed["tracks"]
+        ],
+    }
@@ -1,20 +1,53 @@
+MIDI_NOTES = 128
+
+
+def interval_mask(intervals):
+    # 12 bit pitch class mask of 1-based intervals above a root
+    mask = 0
+    for interval in intervals:
+        mask |= 1 << ((interval - 1) % 12)
+    return mask
+
+
 class Note:
+    """Immutable note, Note(n) for MIDI range n always returns the same object."""
+
+    __slots__ = ("note",)
+
     chromatic_sharps = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
     chromatic_flats = ["C", "Db", "D", "Eb", "E", "F", "Gb", "G", "Ab", "A", "Bb", "B"]
+    name_index = {
+        **{name: i for i, name in enumerate(chromatic_flats)},
+        **{name: i for i, name in enumerate(chromatic_sharps)},
+    }
+    _interned = [None] * MIDI_NOTES
+
+    def __new__(cls, note: int):
+        if 0 <= note < MIDI_NOTES:
+            interned = cls._interned[note]
+            if interned is None:
+                interned = cls._interned[note] = cls._create(note)
+            return interned
+        return cls._create(note)
 
-    def __init__(self, note: int):
-        self.note = note
+    @classmethod
+    def _create(cls, note):
+        self = object.__new__(cls)
+        object.__setattr__(self, "note", note)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return Note, (self.note,)
 
     @staticmethod
     def from_name(name: str, octave: int):
-        if name not in Note.chromatic_sharps and name not in Note.chromatic_flats:
-            raise RecursionError(f"Invalid note: {name} {octave}")
-        section = (
-            Note.chromatic_sharps
-            if name in Note.chromatic_sharps
-            else Note.chromatic_flats
-        )
-        return Note(section.index(name) + octave * len(Note.chromatic_sharps))
+        index = Note.name_index.get(name)
+        if index is None:
+            raise ValueError(f"Invalid note: {name} {octave}")
+        return Note(index + octave * len(Note.chromatic_sharps))
 
     def get_name(self, sharps=True):
         section = Note.chromatic_sharps if sharps else Note.chromatic_flats
@@ -50,6 +83,14 @@ class Note:
 
 
 class Chord:
+    """Immutable chord stored as its root and the pitch class mask above it.
+
+    The notes of a chord built from a name are derived from its chord type,
+    any other voicing passed to Chord(notes) is kept alongside.
+    """
+
+    __slots__ = ("root", "mask", "_voicing")
+
     chord_types = {
         (1, 5, 8): "",
         (1, 4, 8): "m",
@@ -65,21 +106,57 @@ class Chord:
         (1, 5, 8, 15): "add9",
         (1, 5, 8, 11, 15): "9",
     }
+    chord_types_reverse = {v: k for k, v in chord_types.items()}
+    chord_type_masks = {v: interval_mask(k) for k, v in chord_types.items()}
+    chord_types_by_mask = {v: k for k, v in chord_type_masks.items()}
 
     def __init__(self, notes):
         if len(notes) < 2:
             raise ValueError("A chord must have at least 2 notes")
-        self.notes = notes
+        root = notes[0].note
+        mask = interval_mask(note.note - root + 1 for note in notes)
+        voicing = tuple(notes)
+        if voicing == Chord._voice(root, mask):
+            voicing = None  # Derivable, don't store it
+        object.__setattr__(self, "root", root)
+        object.__setattr__(self, "mask", mask)
+        object.__setattr__(self, "_voicing", voicing)
+
+    @classmethod
+    def _create(cls, root, mask, voicing=None):
+        self = object.__new__(cls)
+        object.__setattr__(self, "root", root)
+        object.__setattr__(self, "mask", mask)
+        object.__setattr__(self, "_voicing", voicing)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return Chord._create, (self.root, self.mask, self._voicing)
+
+    @staticmethod
+    def _voice(root, mask):
+        chord_type = Chord.chord_types_by_mask.get(mask)
+        if chord_type is not None:
+            intervals = Chord.chord_types_reverse[chord_type]
+        else:
+            intervals = [i + 1 for i in range(12) if mask >> i & 1]
+        return tuple(Note(interval - 1 + root) for interval in intervals)
+
+    @property
+    def notes(self):
+        if self._voicing is not None:
+            return self._voicing
+        return Chord._voice(self.root, self.mask)
 
     @staticmethod
     def from_name(root_note_str, chord_type):
         root_note = Note.from_name(root_note_str, 4)
-        chord_types_reverse = {v: k for k, v in Chord.chord_types.items()}
-        if chord_type not in chord_types_reverse:
+        if chord_type not in Chord.chord_type_masks:
             raise ValueError(f"Chord type is not defined: {chord_type}")
-        intervals = chord_types_reverse[chord_type]
-        notes = [Note(interval - 1 + root_note.note) for interval in intervals]
-        return Chord(notes)
+        return Chord._create(root_note.note, Chord.chord_type_masks[chord_type])
 
     def __str__(self):
         chord_name = self.get_name()
@@ -89,20 +166,19 @@ class Chord:
         return self.__str__()
 
     def __hash__(self):
-        return sum(hash(note) for note in self.notes)
+        return hash((self.root, self.mask))
 
     def __eq__(self, o):
-        return self.notes == o.notes
+        return isinstance(o, Chord) and self.root == o.root and self.mask == o.mask
 
     def transpose(self, semitones):
-        transposed_notes = [note.transpose(semitones) for note in self.notes]
-        return Chord(transposed_notes)
+        voicing = self._voicing
+        if voicing is not None:
+            voicing = tuple(note.transpose(semitones) for note in voicing)
+        return Chord._create(self.root + semitones, self.mask, voicing)
 
     def get_name(self):
-        root, *_ = self.notes
-        intervals = tuple(sorted([(note - root) + 1 for note in self.notes]))
-        if intervals in Chord.chord_types:
-            chord_type = Chord.chord_types[intervals]
-            name, _ = root.get_name()
-            return name + chord_type
-        return None
+        chord_type = Chord.chord_types_by_mask.get(self.mask)
+        if chord_type is None:
+            return None
+        return Note.chromatic_sharps[self.root % 12] + chord_type
@@ -1,10 +1,26 @@
 from dataclasses import dataclass
 import enum
 import abc
+from functools import lru_cache
+from typing import NamedTuple
 from typing_extensions import override
 from collections import Counter
+import numpy as np
+from .keys import (
+    KEYS,
+    PITCH_CLASS_INDEX,
+    PITCH_CLASSES,
+    estimate_keys,
+    key_errors,
+    pitch_class_histogram,
+)
+from .midi import TrackNotes
 from .music import Note
 
+SIXTY_FOURTHS_PER_BEAT = 16
+SIXTY_FOURTHS_PER_BAR = 4 * SIXTY_FOURTHS_PER_BEAT  # Scores are notated in 4/4
+MIN_REST_LENGTH = 2  # In 64ths, shorter gaps between notes aren't notated
+
 
 class JsonSerializable(abc.ABC):
     @abc.abstractmethod
@@ -63,187 +79,197 @@ class Rest(JsonSerializable):
         return {"keys": ["B/4"], "duration": str(self)}
 
 
-@dataclass
-class StaffNote(JsonSerializable):
-    note: str
-    octave: int
+class DurationSegment(NamedTuple):
+    length: int  # In 64ths
     duration: Duration
+    note: str
+    rest: str
+
+
+def _duration_values():
+    # Every notatable duration as (length in 64ths, Duration), longest first
+    values = []
+    for duration_class in DurationClass:
+        base = SIXTY_FOURTHS_PER_BAR >> duration_class.value
+        for dots in range(3):
+            if base % (1 << dots) == 0:
+                length = base * ((2 << dots) - 1) // (1 << dots)
+                values.append((length, Duration(duration_class, dots)))
+    return sorted(values, key=lambda value: -value[0])
+
+
+def _bar_segments():
+    # The fewest tied durations adding up to each length up to a bar
+    values = _duration_values()
+    table = []
+    for length in range(SIXTY_FOURTHS_PER_BAR + 1):
+        segments = []
+        for value, duration in values:
+            while length >= value:
+                segments.append(
+                    DurationSegment(value, duration, str(duration), str(Rest(duration)))
+                )
+                length -= value
+        table.append(tuple(segments))
+    return tuple(table)
 
-    def __str__(self):
-        return f"{self.note}{self.octave}/{self.duration}"
-
-    def __repr__(self):
-        return self.__str__()
 
-    @override
-    def to_json(self):
-        return {"keys": [f"{self.note}/{self.octave}"], "duration": str(self.duration)}
+BAR_SEGMENTS = _bar_segments()
 
 
-@dataclass
-class PolyStaffNote(JsonSerializable):
-    notes: list[StaffNote]
+class DurationTable:
+    """Maps tick spans to the tied durations notating them.
 
-    def __str__(self):
-        duration = self.notes[0].duration
-        chord = " ".join(f"{note.note}/{note.octave}" for note in self.notes)
-        return f"({chord})/{duration}"
+    Ticks are quantized to 64ths and scores are in 4/4. Spans within a bar are
+    looked up in BAR_SEGMENTS, longer ones are split at the bar lines.
+    """
 
-    def __repr__(self):
-        return self.__str__()
+    def __init__(self, ticks_per_beat):
+        self.ticks_per_beat = ticks_per_beat
+        self.ticks_per_sixty_fourth = ticks_per_beat / SIXTY_FOURTHS_PER_BEAT
 
-    @override
-    def to_json(self):
-        return {
-            "keys": [f"{note.note}/{note.octave}" for note in self.notes],
-            "duration": str(self.notes[0].duration),
-        }
+    def quantize(self, ticks):
+        ticks = np.asarray(ticks, dtype=np.float64)
+        return np.rint(ticks / self.ticks_per_sixty_fourth).astype(np.int64)
 
+    def to_ticks(self, sixty_fourths):
+        return sixty_fourths * self.ticks_per_beat // SIXTY_FOURTHS_PER_BEAT
 
-def convert_ticks_to_duration(ticks_per_beat, delta_ticks):
-    ticks_per_sixty_fourth = int(ticks_per_beat / 2 / 2 / 2 / 2)
-    num_sixty_fourth = delta_ticks // ticks_per_sixty_fourth
-    num_sixty_fourth = num_sixty_fourth & 0b111_1111  # Convert to 7 bits (0-127)
-    durations = [(num_sixty_fourth >> (6 - d.value)) & 1 for d in DurationClass]
-    duration_tuples = enumerate(
-        zip(durations, durations[1:] + [0], durations[2:] + [0] * 2)
-    )
-    duration, context = next(
-        ((i, (b, c)) for i, (a, b, c) in duration_tuples if a), (6, (1, 0, 0))
-    )
-    return Duration(DurationClass(duration), sum(context))
-
-
-def generate_rests(rest, note, ticks_per_beat, last_end_tick):
-    rests = []
-    rest = note["start_tick"] - last_end_tick
-    if rest > 0:
-        num_full_rest = rest // (ticks_per_beat * 2 * 2)
-        for i in range(0, num_full_rest - 1):
-            rests.append(
-                {
-                    "start_tick": last_end_tick + i * ticks_per_beat * 2 * 2,
-                    "end_tick": last_end_tick + (i + 1) * ticks_per_beat * 2 * 2,
-                    "notation": Rest(
-                        convert_ticks_to_duration(
-                            ticks_per_beat, ticks_per_beat * 2 * 2
-                        )
-                    ),
-                }
-            )
-
-        duration = convert_ticks_to_duration(
-            ticks_per_beat, rest - max(num_full_rest - 1, 0) * ticks_per_beat * 2 * 2
-        )
-        if duration.duration_class.value < DurationClass.SixtyFourth.value:
-            rests.append(
-                {
-                    "start_tick": last_end_tick
-                    + max(num_full_rest - 1, 0) * ticks_per_beat * 2 * 2,
-                    "end_tick": note["start_tick"],
-                    "notation": Rest(duration),
-                }
-            )
-    return rests
-
-
-def get_error_values_for_all_keys(observed):
-    key_signatures = {
-        "G#": ["G#", "A#", "B", "C#", "D#", "E", "F"],
-        "D#": ["D#", "E", "F", "G#", "A#", "B", "C"],
-        "A#": ["A#", "B", "C", "D#", "E", "F", "G"],
-        "F": ["F", "G", "A#", "B", "C", "D", "E"],
-        "C": ["C", "D", "E", "F", "G", "A", "B"],
-        "G": ["G", "A", "B", "C", "D", "E", "F#"],
-        "D": ["D", "E", "F#", "G", "A", "B", "C#"],
-        "A": ["A", "B", "C#", "D", "E", "F#", "G#"],
-        "E": ["E", "F#", "G#", "A", "B", "C#", "D#"],
-        "B": ["B", "C#", "D#", "E", "F#", "G#", "A#"],
-        "F#": ["F#", "G#", "A#", "B", "C#", "D#", "F"],
-        "C#": ["C#", "D#", "F", "F#", "G#", "A#", "C"],
-    }
-    key_signatures = {
-        k: {note for note in Note.chromatic_sharps if note in v}
-        for k, v in key_signatures.items()
-    }
-
-    error_values = {}
-    for key, expected_notes in key_signatures.items():
-        error_values[key] = sum(
-            [v for k, v in observed.items() if k not in expected_notes]
+    def split(self, start, length):
+        # Segments of a span of length 64ths starting at the 64th start
+        first = min(length, SIXTY_FOURTHS_PER_BAR - start % SIXTY_FOURTHS_PER_BAR)
+        full_bars, last = divmod(length - first, SIXTY_FOURTHS_PER_BAR)
+        return (
+            BAR_SEGMENTS[first]
+            + BAR_SEGMENTS[SIXTY_FOURTHS_PER_BAR] * full_bars
+            + BAR_SEGMENTS[last]
         )
 
-    return error_values
+    def spans(self, start_tick, end_tick, start, segments):
+        # (start_tick, end_tick, segment) of each segment, the first and last
+        # keep the exact ticks of the span
+        if len(segments) == 1:
+            return [(start_tick, end_tick, segments[0])]
+        spans = []
+        for segment in segments[:-1]:
+            start += segment.length
+            segment_end_tick = self.to_ticks(start)
+            spans.append((start_tick, segment_end_tick, segment))
+            start_tick = segment_end_tick
+        spans.append((start_tick, end_tick, segments[-1]))
+        return spans
 
 
-def estimate_key_signature(notes_count):
-    error_values = get_error_values_for_all_keys(notes_count)
-    return tuple(sorted(error_values.items(), key=lambda item: item[1])[:3])
+@lru_cache
+def duration_table(ticks_per_beat):
+    return DurationTable(ticks_per_beat)
 
 
-def get_notes_count(score):
-    counter = Counter(**{note: 0 for note in Note.chromatic_sharps})
-    for note in score:
-        notation = note["notation"]
-        if isinstance(notation, StaffNote):
-            counter.update({notation.note: 1})
-        elif isinstance(notation, PolyStaffNote):
-            for note in notation.notes:
-                counter.update({note.note: 1})
+def _histogram(observed):
+    histogram = [0] * len(PITCH_CLASSES)
+    for name, count in observed.items():
+        histogram[PITCH_CLASS_INDEX[name]] += count
+    return histogram
+
+
+def get_error_values_for_all_keys(observed, minor=False):
+    errors = key_errors(_histogram(observed), minor)
+    return dict(zip(KEYS, errors.tolist()))
+
 
+def estimate_key_signature(notes_count, minor=False):
+    # notes_count maps note names to counts, or to total durations to weight
+    # notes by how long they sound
+    return estimate_keys(_histogram(notes_count), minor=minor)[0]
+
+
+def get_notes_count(score):
+    # Note names of the entries of a generated score, tied continuations of a
+    # note aren't counted again
+    names = []
+    tied = False
+    for entry in score:
+        notation = entry["notation"]
+        if not tied and "r" not in notation["duration"]:
+            names.extend(key.split("/")[0] for key in notation["keys"])
+        tied = notation.get("tie", False)
+
+    counter = Counter(dict.fromkeys(Note.chromatic_sharps, 0))
+    counter.update(names)
     return counter
 
 
+def _track_ticks(data):
+    if isinstance(data, TrackNotes):
+        return data.notes["start_tick"], data.notes["end_tick"]
+    starts = np.fromiter((note["start_tick"] for note in data), np.int64, len(data))
+    ends = np.fromiter((note["end_tick"] for note in data), np.int64, len(data))
+    return starts, ends
+
+
+def _track_pitch_classes(data):
+    if isinstance(data, TrackNotes):
+        return data.notes["pitch"] % 12
+    return np.fromiter(
+        (PITCH_CLASS_INDEX[note["note"]] for note in data), np.int64, len(data)
+    )
+
+
 def generate_score_from_parsed_midi(parsed):
     scores = []
-    ticks_per_beat = parsed["ticks_per_beat"]
+    table = duration_table(parsed["ticks_per_beat"])
     for track in parsed["tracks"]:
         score = []
-        last_start_tick, last_end_tick = 0, 0
-        for note in track["data"]:
-            # Calculate rests
-            rest = note["start_tick"] - last_end_tick
-            score.extend(generate_rests(rest, note, ticks_per_beat, last_end_tick))
-
-            # Calculate note
-            delta_ticks = note["end_tick"] - note["start_tick"]
-            duration = convert_ticks_to_duration(ticks_per_beat, delta_ticks)
-            staff_note = StaffNote(note["note"], note["octave"], duration)
-
-            # Check if note is played simultaneously
-            if note["start_tick"] == last_start_tick and len(score) != 0:
-                prev_staff_note = score[-1]
-                if isinstance(prev_staff_note["notation"], PolyStaffNote):
-                    prev_staff_note["notation"] = PolyStaffNote(
-                        prev_staff_note["notation"].notes + [staff_note]
-                    )
-                elif isinstance(prev_staff_note["notation"], StaffNote):
-                    prev_staff_note["notation"] = PolyStaffNote(
-                        [prev_staff_note["notation"], staff_note]
+        last_start_tick, last_end_tick, last_end = 0, 0, 0
+        chord = []  # Entries of the last note, tied if it spans several
+        starts, ends = (
+            table.quantize(ticks).tolist() for ticks in _track_ticks(track["data"])
+        )
+        for note, start, end in zip(track["data"], starts, ends):
+            start_tick, end_tick = note["start_tick"], note["end_tick"]
+            key = f"{note['note']}/{note['octave']}"
+
+            if start - last_end >= MIN_REST_LENGTH:
+                segments = table.split(last_end, start - last_end)
+                for span_start, span_end, segment in table.spans(
+                    last_end_tick, start_tick, last_end, segments
+                ):
+                    score.append(
+                        {
+                            "start_tick": span_start,
+                            "end_tick": span_end,
+                            "notation": {"keys": ["B/4"], "duration": segment.rest},
+                        }
                     )
-                score[-1] = prev_staff_note
+                chord = []
+
+            # Notes starting with the previous one join its chord
+            if start_tick == last_start_tick and len(score) != 0:
+                for entry in chord:
+                    entry["notation"]["keys"].append(key)
             else:
-                score.append(
+                segments = table.split(start, max(end - start, 1))
+                chord = [
                     {
-                        "start_tick": note["start_tick"],
-                        "end_tick": note["end_tick"],
-                        "notation": staff_note,
+                        "start_tick": span_start,
+                        "end_tick": span_end,
+                        "notation": {"keys": [key], "duration": segment.note},
                     }
-                )
+                    for span_start, span_end, segment in table.spans(
+                        start_tick, end_tick, start, segments
+                    )
+                ]
+                for entry in chord[:-1]:
+                    entry["notation"]["tie"] = True  # Tied to the next entry
+                score.extend(chord)
 
             # Update last ticks
-            last_start_tick = max(last_start_tick, note["start_tick"])
-            last_end_tick = max(last_end_tick, note["end_tick"])
-
-        notes_count = get_notes_count(score)
-        key_signature = estimate_key_signature(notes_count)
-
-        # serialize StaffNote, PolyStaffNote, Rest
-        for i, note in enumerate(score):
-            if isinstance(note["notation"], JsonSerializable):
-                note["notation"] = note["notation"].to_json()
-                score[i] = note
+            last_start_tick = max(last_start_tick, start_tick)
+            last_end_tick = max(last_end_tick, end_tick)
+            last_end = max(last_end, end)
 
+        histogram = pitch_class_histogram(_track_pitch_classes(track["data"]))
+        (key_signature,) = estimate_keys(histogram)
         scores.append(
             {"name": track["name"], "key_signature": key_signature, "data": score}
         )
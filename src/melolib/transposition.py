@@ -0,0 +1,53 @@
+import numpy as np
+
+from .chord_parser import chord_parser
+from .music import Chord, Note
+
+
+class ChordVocabulary:
+    """Integer ids for every chord type on every root.
+
+    The id of a chord is type index * 12 + root pitch class, which makes the
+    vocabulary closed under transposition. table[id, semitones] is the id of
+    the chord transposed by semitones, so transposing any number of chords is
+    a single gather.
+    """
+
+    def __init__(self):
+        chord_types = list(Chord.chord_types.values())
+        self.names = np.array(
+            [root + t for t in chord_types for root in Note.chromatic_sharps],
+            dtype=object,
+        )
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        chords = np.arange(len(self.names))
+        shifts = np.arange(12)
+        roots = (chords[:, None] % 12 + shifts[None, :]) % 12
+        self.table = (chords[:, None] // 12 * 12 + roots).astype(np.int16)
+        self.table.flags.writeable = False
+
+    def __len__(self):
+        return len(self.names)
+
+    def id(self, name):
+        # Names not spelled like str(Chord), e.g. flats, go through the parser
+        chord_id = self.ids.get(name)
+        if chord_id is None:
+            chord_id = self.ids[str(chord_parser(name))]
+        return chord_id
+
+    def encode(self, names, dtype=np.int16):
+        return np.fromiter((self.id(name) for name in names), dtype=dtype)
+
+    def decode(self, ids):
+        return self.names[ids].tolist()
+
+    def transpose(self, ids, semitones):
+        return self.table[ids, semitones % 12]
+
+    def transpositions(self, ids):
+        # (12, len(ids)) array of ids transposed by 0-11 semitones
+        return self.table[ids].T
+
+
+VOCABULARY = ChordVocabulary()
@@ -1,12 +1,21 @@
+import hashlib
+import io
+import json
 import numpy as np
 import librosa
 import math
+import soundfile
 
 from .music import Note
 
+PYIN_SAMPLE_RATE = 22050
+PYIN_FRAME_LENGTH = 2048
+PYIN_FMIN = float(librosa.note_to_hz("C2"))
+PYIN_FMAX = float(librosa.note_to_hz("C7"))
+MIN_NOTE_DURATION = 0.05
 
-def coalesce_notes_and_rests(notes):
-    coalesced_notes = []
+
+def iter_coalesced_notes_and_rests(notes):
     current_note = None
     current_duration = 0.0
 
@@ -17,16 +26,63 @@ def coalesce_notes_and_rests(notes):
         else:
             if (
                 current_note is not None
-            ):  # If there was a previous note, append it to coalesced_notes
-                coalesced_notes.append((current_note, current_duration))
+            ):  # If there was a previous note, emit it as soon as it is complete
+                yield current_note, current_duration
             current_note = note
             current_duration = duration
 
-    # Append the last note or rest
+    # Emit the last note or rest
     if current_note is not None or current_duration > 0:
-        coalesced_notes.append((current_note, current_duration))
+        yield current_note, current_duration
+
+
+def coalesce_notes_and_rests(notes):
+    return list(iter_coalesced_notes_and_rests(notes))
+
+
+def hz_to_note_codes(f0):
+    # Note numbers as used by Note, -1 for unvoiced frames
+    codes = np.full(len(f0), -1, dtype=np.int64)
+    voiced = f0 > 0
+    codes[voiced] = librosa.hz_to_midi(f0[voiced]).astype(np.int64) - 12
+    return codes
+
+
+def merge_runs(codes, durations):
+    # Run-length encode codes, summing the durations of each run
+    if len(codes) == 0:
+        return codes, durations
+    starts = np.flatnonzero(np.diff(codes, prepend=codes[0] - 1))
+    return codes[starts], np.add.reduceat(durations, starts)
+
+
+def coalesce_note_runs(codes, durations):
+    # Array version of coalesce_notes_and_rests, which keeps only the last rest
+    codes, durations = merge_runs(codes, durations)
+    keep = codes >= 0
+    keep[-1:] = True
+    return codes[keep], durations[keep]
 
-    return coalesced_notes
+
+def clean_note_runs(codes, durations):
+    codes, durations = coalesce_note_runs(codes, durations)
+    keep = durations > MIN_NOTE_DURATION  # Remove all rests/notes that are too short
+    return coalesce_note_runs(codes[keep], durations[keep])
+
+
+def codes_to_notes(codes, durations):
+    return [
+        (Note(code) if code >= 0 else None, duration)
+        for code, duration in zip(codes.tolist(), durations.tolist())
+    ]
+
+
+def clean_notes(notes):
+    notes = iter_coalesced_notes_and_rests(notes)
+    notes = (
+        (note, dt) for note, dt in notes if dt > MIN_NOTE_DURATION
+    )  # Remove all rests/notes that are not too long
+    return iter_coalesced_notes_and_rests(notes)
 
 
 def wav_to_pyin_estimated_pitches(track_path):
@@ -37,27 +93,153 @@ def wav_to_pyin_estimated_pitches(track_path):
 
     f0, _, _ = librosa.pyin(
         track_data,
-        fmin=float(librosa.note_to_hz("C2")),
-        fmax=float(librosa.note_to_hz("C7")),
+        fmin=PYIN_FMIN,
+        fmax=PYIN_FMAX,
         sr=sample_rate,
     )
 
     times = librosa.times_like(f0)
     dt = times[1] - times[0]
 
-    notes = []
-    for f in f0:
-        if f > 0:
-            note = Note(int(librosa.hz_to_midi(f)) - 12)
-            notes.append((note, dt))
-        else:
-            notes.append((None, dt))
+    codes = hz_to_note_codes(f0)
+    return codes_to_notes(*clean_note_runs(codes, np.full(len(codes), dt)))
+
+
+def iter_pyin_frames(track, block_duration=10.0, overlap=1.0):
+    """Runs pyin over the track block by block, yielding (f0, dt) per block.
+
+    The audio is read at its native sample rate with the frame and hop lengths
+    scaled to cover the same time as the batch path. Every block is tracked
+    with `overlap` seconds of context on both sides so the pyin smoothing sees
+    across block boundaries, and frames line up with a centered batch run.
+    Memory is bounded by the block and context sizes, not the clip length.
+    """
+    with soundfile.SoundFile(track) as f:
+        sample_rate = f.samplerate
+        frame_length = round(PYIN_FRAME_LENGTH * sample_rate / PYIN_SAMPLE_RATE)
+        hop_length = frame_length // 4
+        dt = hop_length / sample_rate
+        block_frames = max(1, math.ceil(block_duration / dt))
+        context_frames = math.ceil(overlap / dt)
+
+        # buffer holds the zero padded signal starting at sample buffer_start
+        buffer = np.zeros(frame_length // 2, dtype=np.float32)
+        buffer_start = 0
+        next_frame = 0
+        total_frames = None
+
+        def track_frames(first, last):
+            # f0 of frames [first, last), tracked along with their context
+            start = max(0, first - context_frames)
+            end = last + context_frames
+            if total_frames is not None:
+                end = min(end, total_frames)
+            segment_start = start * hop_length - buffer_start
+            segment_end = (end - 1) * hop_length + frame_length - buffer_start
+            segment = buffer[segment_start:segment_end]
+            if len(segment) < frame_length:
+                segment = np.pad(segment, (0, frame_length - len(segment)))
+            f0, _, _ = librosa.pyin(
+                segment,
+                fmin=PYIN_FMIN,
+                fmax=PYIN_FMAX,
+                sr=sample_rate,
+                frame_length=frame_length,
+                hop_length=hop_length,
+                center=False,
+            )
+            return f0[slice(first - start, last - start)]
+
+        while True:
+            block = f.read(block_frames * hop_length, dtype="float32", always_2d=True)
+            if len(block) == 0:
+                break
+            buffer = np.concatenate((buffer, block.mean(axis=1)))
+            buffer_end = buffer_start + len(buffer)
+            last = next_frame + block_frames
+            while (last + context_frames) * hop_length + frame_length <= buffer_end:
+                yield track_frames(next_frame, last), dt
+                next_frame = last
+                last = next_frame + block_frames
+                # Drop samples that no later block or context looks at
+                drop = (next_frame - context_frames) * hop_length - buffer_start
+                if drop > 0:
+                    buffer = buffer[drop:]
+                    buffer_start += drop
+
+        padding = np.zeros(frame_length // 2, dtype=np.float32)
+        buffer = np.concatenate((buffer, padding))
+        total_frames = 1 + (buffer_start + len(buffer) - frame_length) // hop_length
+        while next_frame < total_frames:
+            last = min(total_frames, next_frame + block_frames)
+            yield track_frames(next_frame, last), dt
+            next_frame = last
+
+
+def iter_pyin_estimated_pitches(track, block_duration=10.0, overlap=1.0):
+    """Streaming counterpart of wav_to_pyin_estimated_pitches.
+
+    Coalesced (note, duration) pairs are yielded as soon as they are final.
+    """
+
+    def note_runs():
+        # Runs within a block are merged with arrays, runs spanning blocks are
+        # merged by the coalescing generators
+        for f0, dt in iter_pyin_frames(track, block_duration, overlap):
+            codes, durations = merge_runs(hz_to_note_codes(f0), np.full(len(f0), dt))
+            for code, duration in zip(codes.tolist(), durations.tolist()):
+                yield (code if code >= 0 else None), duration
+
+    for code, duration in clean_notes(note_runs()):
+        yield (Note(code) if code is not None else None), duration
+
+
+def transcription_cache_key(audio_bytes, streaming=False):
+    # Everything the (note, duration) list depends on, tempo deliberately isn't
+    parameters = {
+        "sample_rate": PYIN_SAMPLE_RATE,
+        "frame_length": PYIN_FRAME_LENGTH,
+        "fmin": PYIN_FMIN,
+        "fmax": PYIN_FMAX,
+        "min_note_duration": MIN_NOTE_DURATION,
+        "streaming": streaming,
+    }
+    digest = hashlib.sha256(audio_bytes)
+    digest.update(json.dumps(parameters, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def encode_notes(notes):
+    return json.dumps(
+        [[note.note if note is not None else None, float(dt)] for note, dt in notes]
+    ).encode()
+
+
+def decode_notes(data):
+    return [
+        (Note(code) if code is not None else None, dt) for code, dt in json.loads(data)
+    ]
+
+
+def cached_pyin_estimated_pitches(wav, cache, streaming=False):
+    """Pitch tracks wav (a path or file object) through a melolib.cache.LRUCache.
+
+    Resubmitting the same audio only costs a hash and a cache lookup.
+    """
+    if hasattr(wav, "read"):
+        audio_bytes = wav.read()
+    else:
+        with open(wav, "rb") as f:
+            audio_bytes = f.read()
+
+    def estimate():
+        track = io.BytesIO(audio_bytes)
+        if streaming:
+            return encode_notes(iter_pyin_estimated_pitches(track))
+        return encode_notes(wav_to_pyin_estimated_pitches(track))
 
-    notes = coalesce_notes_and_rests(notes)
-    notes = [
-        (note, dt) for note, dt in notes if dt > 0.05
-    ]  # Remove all rests/notes that are not too long
-    return coalesce_notes_and_rests(notes)
+    key = transcription_cache_key(audio_bytes, streaming)
+    return decode_notes(cache.get_or_compute(key, estimate))
 
 
 def pyin_estimated_pitches_to_midi(notes, tempo, ticks_per_beat=480):
@@ -90,6 +272,11 @@ def pyin_estimated_pitches_to_midi(notes, tempo, ticks_per_beat=480):
     }
 
 
-def wav_to_midi(wav, tempo):
-    notes = wav_to_pyin_estimated_pitches(wav)
+def wav_to_midi(wav, tempo, streaming=False, cache=None):
+    if cache is not None:
+        notes = cached_pyin_estimated_pitches(wav, cache, streaming)
+    elif streaming:
+        notes = iter_pyin_estimated_pitches(wav)
+    else:
+        notes = wav_to_pyin_estimated_pitches(wav)
     return pyin_estimated_pitches_to_midi(notes, tempo)
@@ -0,0 +1,155 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from ...melolib.accompaniment import render_accompaniment
+from ...melolib.chord_parser import chord_parser
+from ...melolib.midi import TrackNotes
+from ...melolib.music import Chord, Note
+
+
+# The backend's accompaniment tracks as they were before the renderer, with
+# the number of repeats made a parameter
+def track_from_chord_progression_full(chord_progression, ticks_per_beat, repeats):
+    midi_notes = []
+    num_beats = 0
+    beats_per_chord = 4
+    for _ in range(repeats):
+        for chord_repr in chord_progression:
+            notes = list(chord_parser(chord_repr).notes)
+            random.shuffle(notes)
+            for i, note in enumerate(notes):
+                start_tick = int(num_beats * beats_per_chord * ticks_per_beat)
+                end_tick = int(start_tick + ticks_per_beat * beats_per_chord)
+                key, octave = note.get_name()
+                octave = max(2, min(3, octave))
+                midi_notes.append(
+                    {
+                        "note": key,
+                        "octave": octave,
+                        "velocity": 0.4,
+                        "start_tick": start_tick,
+                        "end_tick": end_tick,
+                    }
+                )
+            num_beats += 1
+    return {"name": "Chord progression", "data": midi_notes}
+
+
+def track_from_chord_progression(chord_progression, ticks_per_beat, octaver, repeats):
+    midi_notes = []
+    num_beats = 0
+    beats_per_chord = 4
+    for _ in range(repeats):
+        for chord_repr in chord_progression:
+            chord = chord_parser(chord_repr)
+            notes = list(chord.notes + chord.notes[::-1])
+            random.shuffle(notes)
+            for i, note in enumerate(notes):
+                if random.random() > 0.65:
+                    continue
+                start_tick = int(
+                    (num_beats * beats_per_chord + i * beats_per_chord / len(notes))
+                    * ticks_per_beat
+                )
+                end_tick = int(
+                    start_tick
+                    + ticks_per_beat
+                    * (beats_per_chord / len(notes))
+                    * random.randint(1, 4)
+                )
+                key, octave = note.get_name()
+                octave = max(octaver, min(octaver, octave))
+                midi_notes.append(
+                    {
+                        "note": key,
+                        "octave": octave,
+                        "velocity": 0.7,
+                        "start_tick": start_tick,
+                        "end_tick": end_tick,
+                    }
+                )
+            num_beats += 1
+    return {"name": "Melody Line", "data": midi_notes}
+
+
+def legacy_render(progression, ticks_per_beat, repeats, tracks):
+    rendered = []
+    for _ in range(tracks):
+        rendered.append(
+            track_from_chord_progression(progression, ticks_per_beat, 4, repeats)
+        )
+        rendered.append(
+            track_from_chord_progression_full(progression, ticks_per_beat, repeats)
+        )
+    return [track["data"] for track in rendered]
+
+
+def vectorized_render(progression, ticks_per_beat, repeats, tracks, seed=None):
+    rng = np.random.default_rng(seed)
+    rendered = []
+    for _ in range(tracks):
+        rendered.append(
+            render_accompaniment(progression, ticks_per_beat, repeats=repeats, rng=rng)
+        )
+        rendered.append(
+            render_accompaniment(
+                progression,
+                ticks_per_beat,
+                "block",
+                repeats,
+                octaves=(2, 3),
+                velocity=40,
+                rng=rng,
+            )
+        )
+    return rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "bench_accompaniment", "Benchmarks rendering accompaniment tracks"
+    )
+    parser.add_argument("-c", "--chords", type=int, default=8)
+    parser.add_argument("-r", "--repeats", type=int, default=12)
+    parser.add_argument("-t", "--tracks", type=int, default=4)
+    parser.add_argument("-n", "--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    names = [
+        root + suffix
+        for root in Note.chromatic_sharps
+        for suffix in Chord.chord_types.values()
+        if suffix not in ("+", "maj7")  # Not parsed by chord_parser
+    ]
+    progression = rng.choices(names, k=args.chords)
+    bars = args.chords * args.repeats
+    print(f"{bars} bars, {2 * args.tracks} tracks")
+
+    for label, render in (("legacy", legacy_render), ("vectorized", vectorized_render)):
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            tracks = render(progression, 480, args.repeats, args.tracks)
+        elapsed = (time.perf_counter() - start) / args.runs
+        num_notes = sum(len(track) for track in tracks)
+        print(f"{label:<12} {elapsed * 1000:8.2f}ms {num_notes:8,} notes")
+
+    start = time.perf_counter()
+    tracks = vectorized_render(progression, 480, args.repeats, args.tracks)
+    [TrackNotes(track).tolist() for track in tracks]
+    elapsed = time.perf_counter() - start
+    print(f"{'as dicts':<12} {elapsed * 1000:8.2f}ms")
+
+    first, second = (
+        vectorized_render(progression, 480, args.repeats, args.tracks, seed=1)
+        for _ in range(2)
+    )
+    same = all(np.array_equal(a, b) for a, b in zip(first, second))
+    print(f"Seeded renders identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ...trained_models.chord_inference import ChordInferenceRunner
+from ...trained_models.chord_progression import (
+    get_chord_progression_from_key,
+    load_chord_model,
+)
+
+
+def measure(label, sample, keys, concurrency):
+    latencies = []
+
+    def timed(key):
+        start = time.perf_counter()
+        sample(key, "complex")
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(timed, keys))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(
+        f"{label:<10} {concurrency:>4} clients {len(keys) / elapsed:10,.0f} req/s "
+        f"p50 {p50:7.2f}ms p99 {p99:7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "bench_chord_inference", "Compares eager and runner chord sampling under load"
+    )
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--concurrency", type=int, nargs="*", default=[1, 8])
+    parser.add_argument("-t", "--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    chord_model = load_chord_model()
+    chords = chord_model.unique_chords
+    keys = [chords[i % len(chords)] for i in range(args.requests)]
+
+    runner = ChordInferenceRunner(chord_model=chord_model, num_threads=args.threads)
+    for concurrency in args.concurrency:
+        measure("eager", get_chord_progression_from_key, keys, concurrency)
+        measure("runner", runner.sample, keys, concurrency)
+
+
+if __name__ == "__main__":
+    main()
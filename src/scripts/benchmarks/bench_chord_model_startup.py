@@ -0,0 +1,165 @@
+import argparse
+import functools
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+from torch.utils.data import Dataset
+
+from ...melolib.music import Chord, Note
+from ...trained_models.chord_progression import (
+    DATASET_PATH,
+    HIDDEN_SIZE,
+    METADATA_PATH,
+    STATE_SIZE,
+    TRAINED_MAX_LENGTH,
+    TRAINED_MIN_LENGTH,
+    WEIGHTS_PATH,
+    RNNetwork,
+    UltimateGuitarSongDataset,
+    export_metadata,
+    load_chord_model,
+)
+
+
+def write_synthetic_model(directory, num_songs, seed=0):
+    rng = random.Random(seed)
+    chords = [
+        root + suffix
+        for root in Note.chromatic_sharps
+        for suffix in Chord.chord_types.values()
+        if suffix != "+"  # Not produced by chord_parser
+    ]
+    songs = [
+        ([rng.random(), rng.random(), rng.random() * 3], rng.choices(chords, k=12))
+        for _ in range(num_songs)
+    ]
+    dataset_path = directory / "chord_progressions_augmented.json"
+    with open(dataset_path, "w") as f:
+        json.dump(songs, f)
+
+    unique_chords = sorted({chord for _, song in songs for chord in song[:8]})
+    model = RNNetwork(
+        len(unique_chords) + 3, len(unique_chords), HIDDEN_SIZE, STATE_SIZE
+    )
+    weights_path = directory / "rnn_chord_progressions_classification.pth"
+    torch.save(model.state_dict(), weights_path)
+    return dataset_path, weights_path
+
+
+# The dataset as it was before it stored chord ids, eagerly one-hot encoded
+class LegacyUltimateGuitarSongDataset(Dataset):
+    def __init__(self, filename="out/chord_progressions_augmented.json"):
+        with open(filename) as f:
+            songs_info = json.load(f)
+        songs_info = [
+            (song_info[0], song_info[1][:8])
+            for song_info in songs_info
+            if len(song_info[1]) > 8
+        ]
+        self.songs_info = songs_info
+
+        song_complexities, songs = zip(*songs_info)
+        self.song_complexities = song_complexities
+        self.songs = songs
+
+        self.unique_chords = sorted(
+            list(functools.reduce(lambda acc, x: acc | set(x), songs, set()))
+        )
+
+        self.unique_chords_to_tensors = {}
+        for i, chord in enumerate(self.unique_chords):
+            tensor = torch.zeros(len(self.unique_chords), dtype=torch.long)
+            tensor[i] = 1
+            self.unique_chords_to_tensors[chord] = tensor
+
+        self.data = []
+        for song_complexity, song in songs_info:
+            x = (
+                torch.cat(
+                    (
+                        torch.FloatTensor(song_complexity),
+                        self.unique_chords_to_tensors[chord],
+                    )
+                )
+                for chord in song[:-1]
+            )
+            y = (self.unique_chords_to_tensors[chord] for chord in song[1:])
+            self.data.append((torch.stack(list(x)), torch.stack(list(y))))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx):
+        return self.data[idx]
+
+
+def legacy_startup(dataset_path, weights_path):
+    # What importing the module used to do
+    dataset = LegacyUltimateGuitarSongDataset(dataset_path)
+    output_size = len(dataset.unique_chords)
+    input_size = output_size + len(dataset.song_complexities[0])
+    model = RNNetwork(input_size, output_size, HIDDEN_SIZE, STATE_SIZE)
+    model.load_state_dict(torch.load(weights_path))
+    model.eval()
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "bench_chord_model_startup", "Compares eager and lazy chord model startup"
+    )
+    parser.add_argument("--dataset", default=DATASET_PATH, help="The dataset path")
+    parser.add_argument("--weights", default=WEIGHTS_PATH, help="The weights path")
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="Benchmark a generated dataset with this many songs instead",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_path, weights_path = Path(args.dataset), Path(args.weights)
+        metadata_path = Path(tmp) / Path(METADATA_PATH).name
+        if args.synthetic:
+            dataset_path, weights_path = write_synthetic_model(
+                Path(tmp), args.synthetic
+            )
+
+        start = time.perf_counter()
+        dataset = legacy_startup(dataset_path, weights_path)
+        legacy = time.perf_counter() - start
+        tensor_bytes = sum(
+            x.element_size() * x.nelement() + y.element_size() * y.nelement()
+            for x, y in dataset.data
+        )
+        del dataset
+
+        start = time.perf_counter()
+        dataset = UltimateGuitarSongDataset(
+            dataset_path, TRAINED_MIN_LENGTH, TRAINED_MAX_LENGTH
+        )
+        ids = time.perf_counter() - start
+        id_bytes = sum(
+            t.element_size() * t.nelement()
+            for t in (dataset.chords, dataset.offsets, dataset.complexity)
+        )
+        export_metadata(dataset, metadata_path)
+        del dataset
+
+        start = time.perf_counter()
+        load_chord_model(str(weights_path), str(metadata_path))
+        lazy = time.perf_counter() - start
+
+    print(f"eager dataset + model: {legacy:8.3f}s ({tensor_bytes / 2**20:.1f} MiB)")
+    print(f"chord id dataset:      {ids:8.3f}s ({id_bytes / 2**20:.1f} MiB)")
+    print(f"metadata + model:      {lazy:8.3f}s")
+    print(f"speedup: {legacy / lazy:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import json
+import random
+import re
+import time
+from pathlib import Path
+
+from ...melolib.chord_parser import (
+    TOKENS,
+    chord_parser,
+    chord_parser_cache_clear,
+    parse_many,
+)
+from ...melolib.music import Chord, Note
+
+LYRIC_WORDS = ["love", "the", "I", "you", "Chorus", "Verse", "[Intro]", "x2", "|"]
+
+
+# Parser as it was before patterns were compiled once and results cached
+def legacy_lexer(input_string):
+    patterns = {name: "|".join(values) for name, values in TOKENS.items()}
+    combined_pattern = "|".join(
+        f"(?P<{name}>{pattern})" for name, pattern in patterns.items()
+    )
+    all_tokens = sum([t for t in TOKENS.values()], [])
+    tokens = []
+    for match in re.finditer(combined_pattern, input_string):
+        value = match.group()
+        if value not in all_tokens:
+            raise ValueError(f"Invalid token: {value}")
+        for key, val in TOKENS.items():
+            if value in val:
+                tokens.append((key, value))
+    return tokens
+
+
+def legacy_chord_parser(chord_notation):
+    root_note, chord_type, separator_encountered = "", "", False
+    for token_type, value in legacy_lexer(chord_notation):
+        if token_type == "unknown" or (token_type == "note_name" and root_note):
+            if not separator_encountered:
+                raise ValueError(f"Invalid chord notation: {chord_notation}")
+        elif token_type == "note_name":
+            root_note = value
+        elif token_type == "note_accidentals" and not separator_encountered:
+            root_note += value
+        elif token_type == "chord_type":
+            chord_type += value
+        elif token_type == "separators":
+            separator_encountered = True
+    root = Note.from_name(root_note, 4)
+    chord_types_reverse = {v: k for k, v in Chord.chord_types.items()}
+    intervals = chord_types_reverse[chord_type]
+    return Chord([Note(interval - 1 + root.note) for interval in intervals])
+
+
+def synthetic_corpus(size, seed=0):
+    rng = random.Random(seed)
+    chords = [
+        root + suffix
+        for root in Note.chromatic_sharps + Note.chromatic_flats[1::2]
+        for suffix in Chord.chord_types.values()
+    ]
+    chords += [f"{chord}/{bass}" for chord in chords[:60] for bass in "EGB"]
+    vocabulary = chords + LYRIC_WORDS
+    # Zipf-like weights, a handful of symbols dominate real song sheets
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    rng.shuffle(vocabulary)
+    return rng.choices(vocabulary, weights=weights, k=size)
+
+
+def load_corpus(path, size):
+    with open(path, encoding="utf8") as f:
+        progressions = json.load(f)
+    words = [chord for progression in progressions for chord in progression]
+    return words[:size]
+
+
+def measure(label, fn, words):
+    start = time.perf_counter()
+    fn(words)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.3f}s {len(words) / elapsed:12,.0f} chords/s")
+    return elapsed
+
+
+def parse_each(parser):
+    def run(words):
+        for word in words:
+            try:
+                parser(word)
+            except ValueError:
+                ...
+
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "bench_chord_parser", "Benchmarks the chord parser against a corpus"
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=Path,
+        help="Chord progressions json to sample from (synthetic if omitted)",
+    )
+    parser.add_argument(
+        "-n", "--size", type=int, default=200_000, help="Number of chord symbols"
+    )
+    args = parser.parse_args()
+
+    if args.input is not None:
+        words = load_corpus(args.input, args.size)
+    else:
+        words = synthetic_corpus(args.size)
+    print(f"{len(words):,} symbols, {len(set(words)):,} distinct")
+
+    legacy = measure("legacy", parse_each(legacy_chord_parser), words)
+    chord_parser_cache_clear()
+    cold = measure("chord_parser (cold)", parse_each(chord_parser), words)
+    warm = measure("chord_parser (warm)", parse_each(chord_parser), words)
+    bulk = measure("parse_many (warm)", parse_many, words)
+    print(f"speedup: cold {legacy / cold:.1f}x, warm {legacy / warm:.1f}x, ", end="")
+    print(f"bulk {legacy / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
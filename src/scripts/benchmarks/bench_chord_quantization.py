@@ -0,0 +1,122 @@
+import argparse
+import io
+import math
+import time
+
+import torch
+from torch.utils.data import DataLoader, random_split
+
+from ...trained_models.chord_inference import script_sampler
+from ...trained_models.chord_progression import (
+    DATASET_PATH,
+    PRESETS,
+    TRAINED_MAX_LENGTH,
+    TRAINED_MIN_LENGTH,
+    UltimateGuitarSongDataset,
+    collate_songs,
+    load_chord_model,
+    quantize_model,
+)
+from ...trained_models.train_chord_progression import TOP_K
+
+
+def held_out_loader(args, unique_chords):
+    # The validation split train_chord_progression holds out for the same seed
+    dataset = UltimateGuitarSongDataset(args.dataset, args.min_length, args.max_length)
+    if dataset.unique_chords != unique_chords:
+        raise ValueError(f"{args.dataset} doesn't match the model's chord vocabulary")
+    split = torch.Generator().manual_seed(args.seed)
+    _, test_dataset = random_split(
+        dataset, [1 - args.validation, args.validation], generator=split
+    )
+    return DataLoader(test_dataset, batch_size=256, collate_fn=collate_songs)
+
+
+def parity(float_model, quantized_model, dataloader):
+    chords, float_hits, quantized_hits, agree, kl = 0, 0, 0, 0, 0.0
+    with torch.no_grad():
+        for complexity, inputs, targets, mask in dataloader:
+            expected, _ = float_model.forward_sequence(complexity, inputs)
+            actual, _ = quantized_model.forward_sequence(complexity, inputs)
+            expected, actual, targets = expected[mask], actual[mask], targets[mask]
+            float_top = expected.topk(TOP_K, dim=-1).indices
+            quantized_top = actual.topk(TOP_K, dim=-1).indices
+            float_hits += int((float_top == targets[:, None]).any(dim=-1).sum())
+            quantized_hits += int((quantized_top == targets[:, None]).any(dim=-1).sum())
+            agree += int((expected.argmax(dim=-1) == actual.argmax(dim=-1)).sum())
+            kl += float((expected.exp() * (expected - actual)).sum())
+            chords += len(targets)
+    chords = max(chords, 1)
+    print(
+        f"{chords} held out chords: top {TOP_K} accuracy float "
+        f"{float_hits / chords:.2%}, int8 {quantized_hits / chords:.2%}, "
+        f"top 1 agreement {agree / chords:.2%}, mean KL {kl / chords:.5f}"
+    )
+
+
+def serialized_size(module):
+    buffer = io.BytesIO()
+    if isinstance(module, torch.jit.ScriptModule):
+        torch.jit.save(module, buffer)
+    else:
+        torch.save(module.state_dict(), buffer)
+    return len(buffer.getvalue())
+
+
+def latency(label, model, batch_size, repeats):
+    sampler = script_sampler(model)
+    preset = PRESETS["complex"]
+    complexity = torch.tensor(
+        [[preset["variance"], preset["mean"], preset["entropy"]]] * batch_size,
+        dtype=torch.float32,
+    )
+    chords = torch.zeros(batch_size, dtype=torch.long)
+    uniforms = torch.rand(batch_size, preset["num_chords"] - 1)
+    times = []
+    with torch.no_grad():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            sampler(complexity, chords, uniforms, 3, math.inf)
+            times.append(time.perf_counter() - start)
+    times.sort()
+    print(
+        f"{label:<6} batch {batch_size:>3}: p50 {times[len(times) // 2] * 1e6:8.0f}us "
+        f"p99 {times[int(len(times) * 0.99)] * 1e6:8.0f}us, "
+        f"weights {serialized_size(model):>8,} B, "
+        f"scripted {serialized_size(sampler):>8,} B"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "bench_chord_quantization",
+        "Compares the float and int8 chord models on held out songs and speed",
+    )
+    parser.add_argument(
+        "-i",
+        "--dataset",
+        default=DATASET_PATH,
+        help="The dataset json file or chord corpus directory",
+    )
+    parser.add_argument("--validation", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-length", type=int, default=TRAINED_MIN_LENGTH)
+    parser.add_argument("--max-length", type=int, default=TRAINED_MAX_LENGTH)
+    parser.add_argument("-n", "--repeats", type=int, default=1000)
+    parser.add_argument("-t", "--threads", type=int, default=1)
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    chord_model = load_chord_model()
+    float_model = chord_model.model.cpu()
+    quantized_model = quantize_model(float_model)
+    parity(
+        float_model, quantized_model, held_out_loader(args, chord_model.unique_chords)
+    )
+    for batch_size in (1, 32):
+        latency("float", float_model, batch_size, args.repeats)
+        latency("int8", quantized_model, batch_size, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
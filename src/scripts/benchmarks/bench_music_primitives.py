@@ -0,0 +1,123 @@
+import argparse
+import random
+import time
+import tracemalloc
+
+from ...melolib.music import Chord, Note
+
+
+# Note and Chord as they were before they became slotted and mask based
+class LegacyNote:
+    chromatic_sharps = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+    chromatic_flats = ["C", "Db", "D", "Eb", "E", "F", "Gb", "G", "Ab", "A", "Bb", "B"]
+
+    def __init__(self, note: int):
+        self.note = note
+
+    @staticmethod
+    def from_name(name: str, octave: int):
+        if name not in LegacyNote.chromatic_sharps and name not in (
+            LegacyNote.chromatic_flats
+        ):
+            raise ValueError(f"Invalid note: {name} {octave}")
+        section = (
+            LegacyNote.chromatic_sharps
+            if name in LegacyNote.chromatic_sharps
+            else LegacyNote.chromatic_flats
+        )
+        return LegacyNote(
+            section.index(name) + octave * len(LegacyNote.chromatic_sharps)
+        )
+
+    def get_name(self, sharps=True):
+        section = LegacyNote.chromatic_sharps if sharps else LegacyNote.chromatic_flats
+        name = section[self.note % len(section)]
+        octave = self.note // len(section)
+        return name, octave
+
+    def __hash__(self):
+        return hash(self.note)
+
+    def __eq__(self, o):
+        return isinstance(o, LegacyNote) and self.note == o.note
+
+    def __sub__(self, n):
+        return self.note - n.note
+
+
+class LegacyChord:
+    chord_types = Chord.chord_types
+
+    def __init__(self, notes):
+        if len(notes) < 2:
+            raise ValueError("A chord must have at least 2 notes")
+        self.notes = notes
+
+    @staticmethod
+    def from_name(root_note_str, chord_type):
+        root_note = LegacyNote.from_name(root_note_str, 4)
+        chord_types_reverse = {v: k for k, v in LegacyChord.chord_types.items()}
+        if chord_type not in chord_types_reverse:
+            raise ValueError(f"Chord type is not defined: {chord_type}")
+        intervals = chord_types_reverse[chord_type]
+        notes = [LegacyNote(interval - 1 + root_note.note) for interval in intervals]
+        return LegacyChord(notes)
+
+    def __hash__(self):
+        return sum(hash(note) for note in self.notes)
+
+    def __eq__(self, o):
+        return self.notes == o.notes
+
+    def get_name(self):
+        root, *_ = self.notes
+        intervals = tuple(sorted([(note - root) + 1 for note in self.notes]))
+        if intervals in LegacyChord.chord_types:
+            chord_type = LegacyChord.chord_types[intervals]
+            name, _ = root.get_name()
+            return name + chord_type
+        return None
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {elapsed:8.3f}s {peak / 2**20:10.1f} MiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "bench_music_primitives", "Benchmarks Note and Chord against the old classes"
+    )
+    parser.add_argument("-n", "--size", type=int, default=500_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pitches = [rng.randrange(128) for _ in range(args.size)]
+    names = [(rng.choice(Note.chromatic_flats), rng.randrange(8)) for _ in pitches]
+    chord_names = [
+        (rng.choice(Note.chromatic_sharps), rng.choice(list(Chord.chord_types_reverse)))
+        for _ in pitches
+    ]
+
+    for label, note_cls, chord_cls in (
+        ("legacy", LegacyNote, LegacyChord),
+        ("slotted", Note, Chord),
+    ):
+        print(label)
+        measure("  notes", lambda: [note_cls(pitch) for pitch in pitches])
+        measure("  Note.from_name", lambda: [note_cls.from_name(*n) for n in names])
+        chords = measure(
+            "  chords", lambda: [chord_cls.from_name(*c) for c in chord_names]
+        )
+        measure("  set of chords", lambda: len(set(chords)))
+        measure("  get_name", lambda: [chord.get_name() for chord in chords])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import time
+
+import librosa
+import numpy as np
+
+from ...melolib.music import Note
+from ...melolib.wav_to_midi import (
+    PYIN_FMAX,
+    PYIN_FMIN,
+    clean_note_runs,
+    coalesce_notes_and_rests,
+    codes_to_notes,
+    hz_to_note_codes,
+)
+
+
+# Frame to note stage as it was before it was expressed with arrays
+def legacy_frames_to_notes(f0, dt):
+    notes = []
+    for f in f0:
+        if f > 0:
+            note = Note(int(librosa.hz_to_midi(f)) - 12)
+            notes.append((note, dt))
+        else:
+            notes.append((None, dt))
+
+    notes = coalesce_notes_and_rests(notes)
+    notes = [(note, dt) for note, dt in notes if dt > 0.05]
+    return coalesce_notes_and_rests(notes)
+
+
+def vectorized_frames_to_notes(f0, dt):
+    codes = hz_to_note_codes(f0)
+    return codes_to_notes(*clean_note_runs(codes, np.full(len(codes), dt)))
+
+
+def synthetic_f0(seconds, dt, seed=0):
+    # Hummed melody: notes of varying length with vibrato, breaths and glitches
+    rng = np.random.default_rng(seed)
+    f0 = []
+    while len(f0) * dt < seconds:
+        length = int(rng.choice([0.1, 0.25, 0.5, 1.0]) / dt)
+        if rng.random() < 0.2:
+            f0.extend([np.nan] * length)
+        else:
+            midi = rng.integers(48, 72) + 0.3 * np.sin(np.arange(length) / 3)
+            f0.extend(librosa.midi_to_hz(midi))
+        if rng.random() < 0.3:
+            f0.append(np.nan)
+    return np.array(f0)
+
+
+def measure(label, fn, f0, dt, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        notes = fn(f0, dt)
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<12} {elapsed * 1000:9.2f}ms {elapsed / len(f0) * 1e6:8.3f}us/frame")
+    return elapsed, notes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "bench_note_coalescing", "Benchmarks the frame to note conversion after pyin"
+    )
+    parser.add_argument("-i", "--input", help="Audio file to run pyin on")
+    parser.add_argument(
+        "-s",
+        "--seconds",
+        type=float,
+        default=300,
+        help="Length of the synthetic clip when no input is given",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.input:
+        y, sr = librosa.load(args.input)
+        f0, _, _ = librosa.pyin(y, fmin=PYIN_FMIN, fmax=PYIN_FMAX, sr=sr)
+    else:
+        f0 = synthetic_f0(args.seconds, 512 / 22050)
+    dt = librosa.times_like(f0)[1]
+    print(f"{len(f0):,} frames, {len(f0) * dt:.0f}s")
+
+    legacy, legacy_notes = measure(
+        "legacy", legacy_frames_to_notes, f0, dt, args.repeat
+    )
+    vectorized, notes = measure(
+        "vectorized", vectorized_frames_to_notes, f0, dt, args.repeat
+    )
+    same = len(notes) == len(legacy_notes) and all(
+        a == b and np.isclose(da, db) for (a, da), (b, db) in zip(notes, legacy_notes)
+    )
+    print(f"speedup: {legacy / vectorized:.0f}x, {len(notes)} notes, identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from ...melolib.midi import parse_midi
+from ...melolib.music import Note
+from ...melolib.notation import (
+    Duration,
+    DurationClass,
+    JsonSerializable,
+    Rest,
+    estimate_key_signature,
+    generate_score_from_parsed_midi,
+)
+
+
+# The note notations scores were built from before they became plain dicts
+@dataclass
+class StaffNote(JsonSerializable):
+    note: str
+    octave: int
+    duration: Duration
+
+    def to_json(self):
+        return {"keys": [f"{self.note}/{self.octave}"], "duration": str(self.duration)}
+
+
+@dataclass
+class PolyStaffNote(JsonSerializable):
+    notes: list[StaffNote]
+
+    def to_json(self):
+        return {
+            "keys": [f"{note.note}/{note.octave}" for note in self.notes],
+            "duration": str(self.notes[0].duration),
+        }
+
+
+def get_notes_count(score):
+    counter = Counter(**{note: 0 for note in Note.chromatic_sharps})
+    for note in score:
+        notation = note["notation"]
+        if isinstance(notation, StaffNote):
+            counter.update({notation.note: 1})
+        elif isinstance(notation, PolyStaffNote):
+            for note in notation.notes:
+                counter.update({note.note: 1})
+    return counter
+
+
+# Bit twiddling durations as they were before the duration table, no ties and
+# long notes wrap around
+def convert_ticks_to_duration(ticks_per_beat, delta_ticks):
+    ticks_per_sixty_fourth = int(ticks_per_beat / 2 / 2 / 2 / 2)
+    num_sixty_fourth = delta_ticks // ticks_per_sixty_fourth
+    num_sixty_fourth = num_sixty_fourth & 0b111_1111  # Convert to 7 bits (0-127)
+    durations = [(num_sixty_fourth >> (6 - d.value)) & 1 for d in DurationClass]
+    duration_tuples = enumerate(
+        zip(durations, durations[1:] + [0], durations[2:] + [0] * 2)
+    )
+    duration, context = next(
+        ((i, (b, c)) for i, (a, b, c) in duration_tuples if a), (6, (1, 0, 0))
+    )
+    return Duration(DurationClass(duration), sum(context))
+
+
+def generate_rests(rest, note, ticks_per_beat, last_end_tick):
+    rests = []
+    rest = note["start_tick"] - last_end_tick
+    if rest > 0:
+        num_full_rest = rest // (ticks_per_beat * 2 * 2)
+        for i in range(0, num_full_rest - 1):
+            rests.append(
+                {
+                    "start_tick": last_end_tick + i * ticks_per_beat * 2 * 2,
+                    "end_tick": last_end_tick + (i + 1) * ticks_per_beat * 2 * 2,
+                    "notation": Rest(
+                        convert_ticks_to_duration(
+                            ticks_per_beat, ticks_per_beat * 2 * 2
+                        )
+                    ),
+                }
+            )
+
+        duration = convert_ticks_to_duration(
+            ticks_per_beat, rest - max(num_full_rest - 1, 0) * ticks_per_beat * 2 * 2
+        )
+        if duration.duration_class.value < DurationClass.SixtyFourth.value:
+            rests.append(
+                {
+                    "start_tick": last_end_tick
+                    + max(num_full_rest - 1, 0) * ticks_per_beat * 2 * 2,
+                    "end_tick": note["start_tick"],
+                    "notation": Rest(duration),
+                }
+            )
+    return rests
+
+
+# Score generation as it was before it became a single pass
+def legacy_generate_score_from_parsed_midi(parsed):
+    scores = []
+    ticks_per_beat = parsed["ticks_per_beat"]
+    for track in parsed["tracks"]:
+        score = []
+        last_start_tick, last_end_tick = 0, 0
+        for note in track["data"]:
+            rest = note["start_tick"] - last_end_tick
+            score.extend(generate_rests(rest, note, ticks_per_beat, last_end_tick))
+
+            delta_ticks = note["end_tick"] - note["start_tick"]
+            duration = convert_ticks_to_duration(ticks_per_beat, delta_ticks)
+            staff_note = StaffNote(note["note"], note["octave"], duration)
+
+            if note["start_tick"] == last_start_tick and len(score) != 0:
+                prev_staff_note = score[-1]
+                if isinstance(prev_staff_note["notation"], PolyStaffNote):
+                    prev_staff_note["notation"] = PolyStaffNote(
+                        prev_staff_note["notation"].notes + [staff_note]
+                    )
+                elif isinstance(prev_staff_note["notation"], StaffNote):
+                    prev_staff_note["notation"] = PolyStaffNote(
+                        [prev_staff_note["notation"], staff_note]
+                    )
+                score[-1] = prev_staff_note
+            else:
+                score.append(
+                    {
+                        "start_tick": note["start_tick"],
+                        "end_tick": note["end_tick"],
+                        "notation": staff_note,
+                    }
+                )
+
+            last_start_tick = max(last_start_tick, note["start_tick"])
+            last_end_tick = max(last_end_tick, note["end_tick"])
+
+        notes_count = get_notes_count(score)
+        key_signature = estimate_key_signature(notes_count)
+
+        for i, note in enumerate(score):
+            if isinstance(note["notation"], JsonSerializable):
+                note["notation"] = note["notation"].to_json()
+                score[i] = note
+
+        scores.append(
+            {"name": track["name"], "key_signature": key_signature, "data": score}
+        )
+    return scores
+
+
+def dense_piano_track(num_onsets, max_chord_size, ticks_per_beat, seed=0):
+    rng = random.Random(seed)
+    names = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+    data = []
+    tick = 0
+    for _ in range(num_onsets):
+        length = rng.choice([1, 2, 4]) * ticks_per_beat // rng.choice([1, 2, 4])
+        for _ in range(rng.randint(1, max_chord_size)):
+            data.append(
+                {
+                    "note": rng.choice(names),
+                    "octave": rng.randint(2, 6),
+                    "velocity": 0.8,
+                    "start_tick": tick,
+                    "end_tick": tick + length,
+                }
+            )
+        tick += length + rng.choice([0, 0, 0, ticks_per_beat, 9 * ticks_per_beat])
+    return {"name": "Piano", "data": data}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "bench_score_generation", "Benchmarks score generation on dense piano parts"
+    )
+    parser.add_argument("-i", "--input", nargs="*", help="MIDI files to score")
+    parser.add_argument("-n", "--onsets", type=int, default=20_000)
+    parser.add_argument("-c", "--chord-size", type=int, default=24)
+    args = parser.parse_args()
+
+    if args.input:
+        songs = [parse_midi(path) for path in args.input]
+    else:
+        track = dense_piano_track(args.onsets, args.chord_size, 480)
+        songs = [{"ticks_per_beat": 480, "tracks": [track]}]
+    num_notes = sum(len(t["data"]) for song in songs for t in song["tracks"])
+    print(f"{len(songs)} songs, {num_notes:,} notes")
+
+    results = []
+    for label, generate in (
+        ("legacy", legacy_generate_score_from_parsed_midi),
+        ("single pass", generate_score_from_parsed_midi),
+    ):
+        start = time.perf_counter()
+        results.append([generate(song) for song in songs])
+        elapsed = time.perf_counter() - start
+        print(f"{label:<12} {elapsed:8.3f}s {num_notes / elapsed:12,.0f} notes/s")
+    # Tied durations split notes into several entries, so outputs differ
+    for label, scores in zip(("legacy", "single pass"), results):
+        entries = [e for song in scores for s in song for e in s["data"]]
+        ties = sum(1 for e in entries if e["notation"].get("tie"))
+        print(f"{label:<12} {len(entries):,} entries, {ties:,} tied")
+
+
+if __name__ == "__main__":
+    main()
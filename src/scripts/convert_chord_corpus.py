@@ -0,0 +1,33 @@
+import argparse
+from pathlib import Path
+
+from ..melolib.corpus import corpus_from_json, corpus_to_json, load_corpus, save_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "convert_chord_corpus",
+        "Converts chord progression json files to chord corpus directories and back",
+    )
+    parser.add_argument("input", help="A progressions json file or corpus directory")
+    parser.add_argument(
+        "output",
+        nargs="?",
+        help="The output path, by default the input without or with .json",
+    )
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if input_path.is_dir():
+        output = Path(args.output or input_path.with_suffix(".json"))
+        corpus = load_corpus(input_path)
+        corpus_to_json(corpus, output)
+    else:
+        output = Path(args.output or input_path.with_suffix(""))
+        corpus = corpus_from_json(input_path)
+        save_corpus(corpus, output)
+    print(f"Wrote {len(corpus)} songs, {len(corpus.tokens)} chords to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 import argparse
-import json
 import functools
 import operator
 from pathlib import Path
@@ -9,6 +8,7 @@ import matplotlib.pyplot as plt
 
 from ..melolib.chord2vec import chord2vec
 from ..melolib.chord_progression_parser import chord_progression_parser
+from ..melolib.corpus import load_progressions
 from ..melolib.music import Chord
 
 
@@ -75,7 +75,7 @@ def main():
         "-i",
         "--input",
         default=str(default_input_path),
-        help="The input json file path",
+        help="The input json file or chord corpus directory",
     )
     parser.add_argument(
         "-o",
@@ -112,11 +112,9 @@ def main():
     args = parser.parse_args()
 
     chord_progressions = []
-    with open(args.input, encoding="utf8") as f:
-        chord_progressions_ = json.load(f)
-        for progression in chord_progressions_:
-            chord_progression = chord_progression_parser(progression)
-            chord_progressions.append(list(map(str, chord_progression)))
+    for progression in load_progressions(args.input):
+        chord_progression = chord_progression_parser(progression)
+        chord_progressions.append(list(map(str, chord_progression)))
 
     model = generate_chord_vectors(chord_progressions, args)
     if args.plot:
@@ -1,51 +1,206 @@
-import glob
+import argparse
+import hashlib
 import json
-from ...melolib.chord_parser import chord_parser
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
+import numpy as np
 
-def line_has_chords(line, threshold=0.8):
-    total_words = len(line.split())
-    if total_words == 0:
-        return False
-    words_with_chords = 0
-    for word in line.split():
-        if len(word) < 10:  # Ignore long words
+from ...melolib.chord_parser import parse_many
+from ...melolib.corpus import ChordCorpus, save_corpus
+from ...melolib.transposition import VOCABULARY
+
+OUT_DIR = Path(__file__).parent.parent.parent.parent / "out"
+
+_known_songs = frozenset()
+
+
+def extract_chords(lines, threshold=0.8):
+    chords = []
+    for line in lines:
+        words = line.split()
+        if len(words) == 0:
+            continue
+        parsed = parse_many(words)
+        words_with_chords = sum(
+            1
+            for word, (chord, _) in zip(words, parsed)
+            if chord is not None and len(word) < 10  # Ignore long words
+        )
+        if words_with_chords / len(words) > threshold:
+            chords.extend(str(chord) for chord, _ in parsed if chord is not None)
+    return chords
+
+
+def _init_worker(known_songs):
+    global _known_songs
+    _known_songs = known_songs
+
+
+def process_song(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha1(content).hexdigest()
+    if (path, digest) in _known_songs:
+        return path, digest, None
+    text = content.decode("utf8", errors="replace")
+    return path, digest, extract_chords(text.splitlines())
+
+
+def read_manifest(manifest_path):
+    if not manifest_path.exists():
+        return
+    with open(manifest_path, encoding="utf8") as f:
+        for line in f:
             try:
-                chord_parser(word)
-                words_with_chords += 1
-            except Exception:
-                ...
-    return words_with_chords / total_words > threshold
-
-
-def is_chord(word):
-    try:
-        chord_parser(word)
-        return True
-    except Exception:
-        return False
-
-
-songs = []
-for semitones in range(12):
-    for path in glob.glob("out/songs/*"):
-        chords = []
-        with open(path) as f:
-            total_lines = 0
-            lines_predicted_to_have_chords = 0
-            for line in f:
-                if line_has_chords(line):
-                    chords.extend(
-                        [
-                            str(chord_parser(word.strip()).transpose(semitones))
-                            for word in line.split()
-                            if is_chord(word.strip())
-                        ]
-                    )
-        songs.append(chords)
-
-with open("out/all_chord_progressions.json", "w") as f:
-    f.write(json.dumps(songs))
-
-with open("out/chord_progressions.json", "w") as f:
-    f.write(json.dumps(songs[: len(songs) // 3]))
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                ...  # Partially written record from an interrupted run
+
+
+def update_manifest(paths, manifest_path, jobs):
+    # Songs are keyed by path and content, so files with the same content are
+    # kept as separate songs and an edited file is parsed again
+    known_songs = frozenset(
+        (record["path"], record["sha1"]) for record in read_manifest(manifest_path)
+    )
+    songs = set()
+    parsed = 0
+    with open(manifest_path, "a", encoding="utf8") as manifest, ProcessPoolExecutor(
+        jobs, initializer=_init_worker, initargs=(known_songs,)
+    ) as executor:
+        for path, digest, chords in executor.map(process_song, paths, chunksize=32):
+            songs.add((path, digest))
+            if chords is None:
+                continue
+            manifest.write(json.dumps({"sha1": digest, "path": path, "chords": chords}))
+            manifest.write("\n")
+            parsed += 1
+    print(f"Parsed {parsed} songs, {len(songs) - parsed} unchanged")
+    return songs
+
+
+def encode_songs(manifest_path, songs):
+    # Chord ids of all songs back to back, and where each song starts, read
+    # one manifest record at a time
+    lengths = [0]
+
+    def chords():
+        remaining = set(songs)
+        for record in read_manifest(manifest_path):
+            song = (record["path"], record["sha1"])
+            if song in remaining:
+                remaining.remove(song)
+                lengths.append(len(record["chords"]))
+                yield from record["chords"]
+
+    ids = VOCABULARY.encode(chords())
+    return ids, np.cumsum(lengths)
+
+
+def write_corpora(ids, offsets, all_path, subset_path):
+    # The same songs as write_progressions, as chord corpus directories
+    num_songs = len(offsets) - 1
+    tokens = VOCABULARY.transpositions(ids).ravel()
+    all_offsets = np.concatenate(
+        [offsets[:-1] + semitones * len(ids) for semitones in range(12)]
+        + [[len(tokens)]]
+    )
+    vocab = VOCABULARY.names.tolist()
+    no_complexity = np.empty((12 * num_songs, 0), dtype=np.float32)
+    save_corpus(ChordCorpus(vocab, tokens, all_offsets, no_complexity), all_path)
+    subset_size = 12 * num_songs // 3
+    subset_offsets = all_offsets[: subset_size + 1]
+    subset = ChordCorpus(
+        vocab,
+        tokens[: subset_offsets[-1]],
+        subset_offsets,
+        no_complexity[:subset_size],
+    )
+    save_corpus(subset, subset_path)
+
+
+def write_progressions(manifest_path, songs, all_path, subset_path):
+    ids, offsets = encode_songs(manifest_path, songs)
+    total = 12 * (len(offsets) - 1)
+    subset_size = total // 3
+    bounds = list(zip(offsets[:-1].tolist(), offsets[1:].tolist()))
+    with open(all_path, "w") as all_file, open(subset_path, "w") as subset_file:
+        all_file.write("[")
+        subset_file.write("[")
+        count = 0
+        for semitones in range(12):
+            transposed = VOCABULARY.transpose(ids, semitones)
+            for start, end in bounds:
+                song_json = json.dumps(VOCABULARY.decode(transposed[start:end]))
+                separator = ", " if count != 0 else ""
+                all_file.write(separator + song_json)
+                if count < subset_size:
+                    subset_file.write(separator + song_json)
+                count += 1
+        all_file.write("]")
+        subset_file.write("]")
+    return ids, offsets
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "generate_chord_progressions",
+        "Extracts chord progressions and their 12 transpositions from scraped songs",
+    )
+    parser.add_argument(
+        "-s",
+        "--songs",
+        default=str(OUT_DIR / "songs"),
+        help="The directory with scraped song sheets",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=str(OUT_DIR),
+        help="The output directory",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="The number of worker processes",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Reparse every song instead of reusing the manifest",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="store_true",
+        help="Also write the progressions as chord corpus directories",
+    )
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    manifest_path = output / "chord_progressions_manifest.jsonl"
+    if args.no_resume and manifest_path.exists():
+        manifest_path.unlink()
+
+    paths = sorted(str(path) for path in Path(args.songs).iterdir())
+    songs = update_manifest(paths, manifest_path, args.jobs)
+    ids, offsets = write_progressions(
+        manifest_path,
+        songs,
+        output / "all_chord_progressions.json",
+        output / "chord_progressions.json",
+    )
+    if args.corpus:
+        write_corpora(
+            ids,
+            offsets,
+            output / "all_chord_progressions",
+            output / "chord_progressions",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import math
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+
+from .chord_progression import (
+    METADATA_PATH,
+    PRESETS,
+    WEIGHTS_PATH,
+    RNNetwork,
+    load_chord_model,
+)
+
+SCRIPTED_PATH = "out/rnn_chord_progressions_sampler.pt"
+QUANTIZED_SCRIPTED_PATH = "out/rnn_chord_progressions_sampler_int8.pt"
+
+
+class ChordSampler(torch.nn.Module):
+    """RNNetwork and the top-k sampling loop, in a form torch.jit.script takes.
+
+    Chords are drawn by inverse CDF from the uniforms passed in, so the
+    scripted module needs no random generator of its own. An infinite
+    temperature samples uniformly among the top k chords.
+    """
+
+    def __init__(self, model: RNNetwork):
+        super().__init__()
+        self.model = model
+        self.state_size = model.state_size
+
+    def forward(
+        self,
+        complexity: torch.Tensor,
+        chords: torch.Tensor,
+        uniforms: torch.Tensor,
+        top_k: int,
+        temperature: float,
+    ) -> torch.Tensor:
+        state = torch.zeros(chords.shape[0], self.state_size, device=chords.device)
+        steps = [chords]
+        for t in range(uniforms.shape[1]):
+            log_probs, state = self.model.step(complexity, chords, state)
+            if math.isinf(temperature):
+                logits = torch.zeros_like(log_probs)
+            else:
+                logits = log_probs / temperature
+            if top_k < log_probs.shape[-1]:
+                kth = torch.topk(log_probs, top_k, dim=-1).values[:, -1:]
+                logits = logits.masked_fill(log_probs < kth, -math.inf)
+            cdf = torch.cumsum(torch.softmax(logits, dim=-1), dim=-1)
+            targets = uniforms[:, t].unsqueeze(-1) * cdf[:, -1:]
+            chords = torch.searchsorted(cdf, targets).squeeze(-1)
+            chords = chords.clamp(max=log_probs.shape[-1] - 1)
+            steps.append(chords)
+        return torch.stack(steps, dim=1)
+
+
+def script_sampler(model):
+    return torch.jit.script(ChordSampler(model).eval())
+
+
+def export_sampler(
+    path=SCRIPTED_PATH,
+    weights_path=WEIGHTS_PATH,
+    metadata_path=METADATA_PATH,
+    quantized=False,
+):
+    chord_model = load_chord_model(weights_path, metadata_path, quantized)
+    sampler = script_sampler(chord_model.model)
+    sampler.save(path)
+    return sampler
+
+
+class ChordInferenceRunner:
+    """Runs chord sampling on one thread with a fixed intra-op thread budget.
+
+    Requests arriving within max_wait seconds of each other are sampled as a
+    single batch of at most max_batch progressions.
+    """
+
+    def __init__(
+        self,
+        sampler=None,
+        chord_model=None,
+        num_threads=1,
+        max_batch=32,
+        max_wait=0.005,
+        top_k=3,
+        temperature=math.inf,
+        seed=None,
+    ):
+        self.chord_model = chord_model or load_chord_model()
+        self.sampler = sampler or script_sampler(self.chord_model.model)
+        self.num_threads = num_threads
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.top_k = top_k
+        self.temperature = temperature
+        self.generator = torch.Generator()
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, preset_type):
+        # Bad requests fail on their own rather than with the batch they join
+        future = Future()
+        if key not in self.chord_model.chord_indices:
+            future.set_exception(KeyError(f"Unknown chord: {key}"))
+        elif preset_type not in PRESETS:
+            future.set_exception(KeyError(f"Unknown preset: {preset_type}"))
+        else:
+            self._requests.put((key, preset_type, future))
+        return future
+
+    def sample(self, key, preset_type):
+        return self.submit(key, preset_type).result()
+
+    def _next_batch(self):
+        batch = [self._requests.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._requests.get(timeout=self.max_wait))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        torch.set_num_threads(self.num_threads)
+        while True:
+            batch = self._next_batch()
+            try:
+                progressions = self._sample([(key, p) for key, p, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), progression in zip(batch, progressions):
+                future.set_result(progression)
+
+    def _sample(self, requests):
+        chord_model = self.chord_model
+        presets = [PRESETS[preset_type] for _, preset_type in requests]
+        num_chords = [preset["num_chords"] for preset in presets]
+        complexity = torch.tensor(
+            [[p["variance"], p["mean"], p["entropy"]] for p in presets],
+            dtype=torch.float32,
+        )
+        chords = torch.tensor([chord_model.chord_indices[key] for key, _ in requests])
+        uniforms = torch.rand(
+            len(requests), max(num_chords) - 1, generator=self.generator
+        )
+        with torch.no_grad():
+            steps = self.sampler(
+                complexity, chords, uniforms, self.top_k, self.temperature
+            )
+        return [
+            [chord_model.unique_chords[idx] for idx in progression[:length]]
+            for progression, length in zip(steps.tolist(), num_chords)
+        ]
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    # The process wide runner, loading an exported sampler if there is one
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            quantized = os.environ.get("MELOWAVE_CHORD_QUANTIZED", "0") == "1"
+            path = QUANTIZED_SCRIPTED_PATH if quantized else SCRIPTED_PATH
+            sampler = torch.jit.load(path) if os.path.exists(path) else None
+            _runner = ChordInferenceRunner(
+                sampler,
+                load_chord_model(quantized=quantized),
+                num_threads=int(os.environ.get("MELOWAVE_CHORD_THREADS", 1)),
+            )
+        return _runner
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "chord_inference", "Exports the chord model and its sampler as TorchScript"
+    )
+    parser.add_argument("-w", "--weights", default=WEIGHTS_PATH)
+    parser.add_argument("-m", "--metadata", default=METADATA_PATH)
+    parser.add_argument("-o", "--output", default=None)
+    parser.add_argument(
+        "-q",
+        "--quantized",
+        action="store_true",
+        help="Export the int8 dynamically quantized model",
+    )
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = QUANTIZED_SCRIPTED_PATH if args.quantized else SCRIPTED_PATH
+    export_sampler(args.output, args.weights, args.metadata, args.quantized)
+    print(f"Exported {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,118 @@
+import argparse
+import copy
 import functools
 import json
+import math
+from dataclasses import dataclass
+import numpy as np
 import torch
 import torch.nn
-import random
+from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data import Dataset
 
+try:
+    from ..melolib.corpus import load_progressions, token_dtype
+except ImportError:  # Imported as a top level package, as the backend does
+    from melolib.corpus import load_progressions, token_dtype
+
 
 class UltimateGuitarSongDataset(Dataset):
-    def __init__(self, filename="out/chord_progressions_augmented.json"):
-        with open(filename) as f:
-            songs_info = json.load(f)
-        songs_info = [
-            (song_info[0], song_info[1][:8])
-            for song_info in songs_info
-            if len(song_info[1]) > 8
-        ]
-        self.songs_info = songs_info
+    """Songs as chord ids into unique_chords plus their complexity features.
+
+    Songs shorter than min_length are skipped and, if max_length is given,
+    longer ones are truncated. Samples are (complexity, chords) pairs of a
+    float tensor and a variable length long tensor, batch them with
+    collate_songs.
+    """
+
+    def __init__(
+        self,
+        filename="out/chord_progressions_augmented.json",
+        min_length=2,
+        max_length=None,
+    ):
+        # A json file or a melolib.corpus directory
+        corpus = load_progressions(filename)
+        lengths = corpus.lengths()
+        keep = lengths >= min_length
+        starts = np.asarray(corpus.offsets[:-1])[keep]
+        lengths = lengths[keep]
+        if max_length is not None:
+            lengths = np.minimum(lengths, max_length)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
 
-        song_complexities, songs = zip(*songs_info)
-        self.song_complexities = song_complexities
-        self.songs = songs
+        # Gather the kept chords, then renumber them into the sorted vocabulary
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        tokens = np.asarray(corpus.tokens)[positions]
+        used = np.unique(tokens)
+        self.unique_chords = sorted(corpus.vocab[token] for token in used.tolist())
+        chord_indices = {chord: i for i, chord in enumerate(self.unique_chords)}
+        renumber = np.zeros(len(corpus.vocab), dtype=np.int64)
+        renumber[used] = [chord_indices[corpus.vocab[token]] for token in used.tolist()]
 
-        self.unique_chords = sorted(
-            list(functools.reduce(lambda acc, x: acc | set(x), songs, set()))
+        chords = renumber[tokens].astype(token_dtype(len(self.unique_chords)))
+        self.chords = torch.from_numpy(chords)
+        self.offsets = torch.from_numpy(offsets.astype(np.int64))
+        self.complexity = torch.from_numpy(
+            np.asarray(corpus.complexity, dtype=np.float32)[keep]
         )
 
-        self.unique_chords_to_tensors = {}
-        for i, chord in enumerate(self.unique_chords):
-            tensor = torch.zeros(len(self.unique_chords), dtype=torch.long)
-            tensor[i] = 1
-            self.unique_chords_to_tensors[chord] = tensor
-
-        self.data = []
-        for song_complexity, song in songs_info:
-            x = (
-                torch.cat(
-                    (
-                        torch.FloatTensor(song_complexity),
-                        self.unique_chords_to_tensors[chord],
-                    )
-                )
-                for chord in song[:-1]
-            )
-            y = (self.unique_chords_to_tensors[chord] for chord in song[1:])
-            self.data.append((torch.stack(list(x)), torch.stack(list(y))))
+    @property
+    def complexity_size(self):
+        return self.complexity.shape[1]
+
+    @property
+    def song_complexities(self):
+        return self.complexity
 
     def __len__(self):
-        return len(self.data)
+        return len(self.offsets) - 1
 
     def __getitem__(self, idx):
-        return self.data[idx]
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.complexity[idx], self.chords[start:end].long()
+
+
+def collate_songs(batch):
+    """Pads (complexity, chords) samples for teacher forced training.
 
+    Returns complexity (batch, complexity_size), input and target chord ids
+    (batch, steps) padded with 0, and a bool mask of the real steps.
+    """
+    complexity = torch.stack([complexity for complexity, _ in batch])
+    inputs = pad_sequence([chords[:-1] for _, chords in batch], batch_first=True)
+    targets = pad_sequence([chords[1:] for _, chords in batch], batch_first=True)
+    steps = torch.tensor([len(chords) - 1 for _, chords in batch])
+    mask = torch.arange(inputs.shape[1]) < steps[:, None]
+    return complexity, inputs, targets, mask
 
-dataset = UltimateGuitarSongDataset()
 
-OUTPUT_SIZE = len(dataset.unique_chords)
-INPUT_SIZE = OUTPUT_SIZE + len(dataset.song_complexities[0])
+def one_hot_inputs(complexity, inputs, vocab_size):
+    # The dense cat(complexity, one_hot(chord)) rows RNNetwork.forward takes
+    complexity = complexity[:, None, :].expand(-1, inputs.shape[1], -1)
+    return torch.cat(
+        (complexity, torch.nn.functional.one_hot(inputs, vocab_size).float()), dim=-1
+    )
+
+
+DATASET_PATH = "out/chord_progressions_augmented.json"
+WEIGHTS_PATH = "out/rnn_chord_progressions_classification.pth"
+METADATA_PATH = "out/rnn_chord_progressions_classification.json"
+
 HIDDEN_SIZE = 30
 STATE_SIZE = 15
+# Song lengths the shipped weights were trained on, which fix their vocabulary
+TRAINED_MIN_LENGTH = 9
+TRAINED_MAX_LENGTH = 8
+
+# Only h2o does a dense matmul, step reads i2s and i2h as weight lookups
+QUANTIZED_LAYERS = {"h2o"}
+
+PRESETS = {
+    "simple": {"variance": 0.05, "mean": 0.45, "entropy": 2, "num_chords": 4},
+    "advanced": {"variance": 1.0, "mean": 1.0, "entropy": 2.8, "num_chords": 6},
+    "complex": {"variance": 2, "mean": 1, "entropy": 3, "num_chords": 8},
+}
 
 
 class RNNetwork(torch.nn.Module):
@@ -82,8 +137,62 @@ class RNNetwork(torch.nn.Module):
         o = self.dropout(o)
         return self.softmax(o), s
 
-    def init_hidden(self):
-        return torch.zeros(self.state_size)
+    def _project_inputs(self, weight, bias, complexity, chords):
+        # The complexity and chord part of linear(cat(complexity, one_hot(chords),
+        # state)), with the one-hot product replaced by a lookup of weight columns
+        c = complexity.shape[-1]
+        v = c + self.output_size
+        if chords.dim() == 2:
+            complexity = complexity[:, None, :]
+        return complexity @ weight[:, :c].T + weight[:, c:v].T[chords] + bias
+
+    def _project_state(self, weight, state):
+        return state @ weight.narrow(1, self.input_size, self.state_size).T
+
+    def _project(self, weight, bias, complexity, chords, state):
+        return self._project_inputs(
+            weight, bias, complexity, chords
+        ) + self._project_state(weight, state)
+
+    def step(self, complexity, chords, state):
+        """Batched forward step taking chord indices instead of one-hot vectors.
+
+        complexity is (batch, complexity_size), chords is (batch,) and state is
+        (batch, state_size). Returns log probabilities and the next state.
+        """
+        s = self._project(self.i2s.weight, self.i2s.bias, complexity, chords, state)
+        h = self._project(self.i2h.weight, self.i2h.bias, complexity, chords, state)
+        o = self.h2o(torch.relu(h))
+        o = self.dropout(o)
+        return torch.log_softmax(o, dim=-1), s
+
+    def forward_sequence(self, complexity, chords, state=None):
+        """step over whole (batch, steps) chord id sequences.
+
+        The input projections and outputs of all steps are computed at once,
+        only the linear state recurrence runs step by step. Returns (batch,
+        steps, output_size) log probabilities and the final state.
+        """
+        if state is None:
+            state = self.init_hidden(chords.shape[0]).to(chords.device)
+        i2s, i2h = self.i2s, self.i2h
+        s_inputs = self._project_inputs(i2s.weight, i2s.bias, complexity, chords)
+        states = []
+        for t in range(chords.shape[1]):
+            states.append(state)
+            state = s_inputs[:, t] + self._project_state(i2s.weight, state)
+        previous = torch.stack(states, dim=1)  # The state each step started from
+
+        h = self._project_inputs(i2h.weight, i2h.bias, complexity, chords)
+        h = h + self._project_state(i2h.weight, previous)
+        o = self.h2o(torch.relu(h))
+        o = self.dropout(o)
+        return torch.log_softmax(o, dim=-1), state
+
+    def init_hidden(self, batch_size=None):
+        if batch_size is None:
+            return torch.zeros(self.state_size)
+        return torch.zeros(batch_size, self.state_size)
 
 
 device = (
@@ -94,38 +203,176 @@ device = (
     else "cpu"
 )
 
-model = RNNetwork(INPUT_SIZE, OUTPUT_SIZE, HIDDEN_SIZE, STATE_SIZE).to(device)
-model.load_state_dict(torch.load("out/rnn_chord_progressions_classification.pth"))
-model.eval()
 
+@dataclass(frozen=True)
+class ChordModel:
+    unique_chords: list
+    chord_indices: dict
+    complexity_size: int
+    model: RNNetwork
 
-def get_chord_progression_from_key(key, preset_type):
-    presets = {
-        "simple": {"variance": 0.05, "mean": 0.45, "entropy": 2, "num_chords": 4},
-        "advanced": {"variance": 1.0, "mean": 1.0, "entropy": 2.8, "num_chords": 6},
-        "complex": {"variance": 2, "mean": 1, "entropy": 3, "num_chords": 8},
+
+def export_metadata(dataset, path=METADATA_PATH):
+    # Everything inference needs from the dataset, without the training tensors
+    metadata = {
+        "unique_chords": dataset.unique_chords,
+        "complexity_size": dataset.complexity_size,
+        "hidden_size": HIDDEN_SIZE,
+        "state_size": STATE_SIZE,
     }
-    preset = presets[preset_type]
+    with open(path, "w") as f:
+        json.dump(metadata, f)
+    return metadata
+
 
-    complexity_tensor = torch.FloatTensor(
-        [preset["variance"], preset["mean"], preset["entropy"]]
+def load_metadata(path=METADATA_PATH, dataset_path=DATASET_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        dataset = UltimateGuitarSongDataset(
+            dataset_path, TRAINED_MIN_LENGTH, TRAINED_MAX_LENGTH
+        )
+        return export_metadata(dataset, path)
+
+
+def quantize_model(model):
+    """CPU copy of an RNNetwork with int8 dynamically quantized QUANTIZED_LAYERS."""
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(model).cpu(), QUANTIZED_LAYERS, dtype=torch.qint8, inplace=True
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load_chord_model(
+    weights_path=WEIGHTS_PATH, metadata_path=METADATA_PATH, quantized=False
+):
+    metadata = load_metadata(metadata_path)
+    unique_chords = metadata["unique_chords"]
+    output_size = len(unique_chords)
+    input_size = output_size + metadata["complexity_size"]
+
+    model = RNNetwork(
+        input_size, output_size, metadata["hidden_size"], metadata["state_size"]
+    ).to(device)
+    model.load_state_dict(torch.load(weights_path, map_location=device))
+    model.eval()
+    if quantized:
+        model = quantize_model(model)
+    return ChordModel(
+        unique_chords,
+        {chord: i for i, chord in enumerate(unique_chords)},
+        metadata["complexity_size"],
+        model,
     )
 
 
-    chord_progression = [key]
+def filter_logits(log_probs, top_k=None, top_p=None, temperature=1.0):
+    if math.isinf(temperature):
+        # Uniform over whatever survives the top-k/top-p filters
+        logits = torch.zeros_like(log_probs)
+    else:
+        logits = log_probs / temperature
+
+    remove = torch.zeros_like(log_probs, dtype=torch.bool)
+    if top_k is not None and top_k < log_probs.shape[-1]:
+        kth = torch.topk(log_probs, top_k, dim=-1).values[..., -1:]
+        remove |= log_probs < kth
+    if top_p is not None and top_p < 1.0:
+        sorted_log_probs, order = torch.sort(log_probs, dim=-1, descending=True)
+        probs = torch.softmax(sorted_log_probs, dim=-1)
+        # Drop a chord once the more likely ones already cover top_p
+        sorted_remove = torch.cumsum(probs, dim=-1) - probs >= top_p
+        remove |= sorted_remove.scatter(-1, order, sorted_remove)
+    return logits.masked_fill(remove, -math.inf)
+
+
+def sample_chord_progressions(
+    requests,
+    num_samples=1,
+    top_k=3,
+    top_p=None,
+    temperature=1.0,
+    generator=None,
+):
+    """Samples num_samples progressions for every (key, preset_type) request.
+
+    All requests are advanced together, one batched model step per chord.
+    Returns a list with num_samples progressions per request.
+    """
+    chord_model = load_chord_model()
+    model = chord_model.model
+    presets = [PRESETS[preset_type] for _, preset_type in requests]
+    num_chords = [preset["num_chords"] for preset in presets]
+
+    complexity = torch.tensor(
+        [[p["variance"], p["mean"], p["entropy"]] for p in presets],
+        dtype=torch.float32,
+        device=device,
+    ).repeat_interleave(num_samples, dim=0)
+    chords = torch.tensor(
+        [chord_model.chord_indices[key] for key, _ in requests], device=device
+    ).repeat_interleave(num_samples)
+
+    steps = [chords]
     with torch.no_grad():
-        state = model.init_hidden()
-        pred = dataset.unique_chords_to_tensors[key]
-        for _ in range(preset["num_chords"] - 1):
-            pred, state = model(torch.cat((complexity_tensor, pred)), state)
-            prob = torch.exp(pred)
-            prob = prob / torch.sum(prob)
-            _, idxs = torch.topk(prob, k=3)
-            pred_idx = random.choice(idxs).item()
-            predicted_chord = dataset.unique_chords[pred_idx]
-            chord_progression.append(predicted_chord)
-
-            pred = torch.zeros(len(dataset.unique_chords))
-            pred[pred_idx] = 1
-
-    return chord_progression
+        state = model.init_hidden(len(chords)).to(device)
+        for _ in range(max(num_chords) - 1):
+            log_probs, state = model.step(complexity, chords, state)
+            probs = torch.softmax(
+                filter_logits(log_probs, top_k, top_p, temperature), dim=-1
+            )
+            chords = torch.multinomial(probs, 1, generator=generator).squeeze(-1)
+            steps.append(chords)
+
+    progressions = iter(torch.stack(steps, dim=1).tolist())
+    return [
+        [
+            [chord_model.unique_chords[idx] for idx in next(progressions)[:length]]
+            for _ in range(num_samples)
+        ]
+        for length in num_chords
+    ]
+
+
+def get_chord_progression_from_key(key, preset_type):
+    # Uniform choice among the three most likely chords at every step
+    (progression,) = sample_chord_progressions(
+        [(key, preset_type)], top_k=3, temperature=math.inf
+    )[0]
+    return progression
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "chord_progression", "Exports the chord model metadata used for inference"
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        default=DATASET_PATH,
+        help="The dataset json file or chord corpus directory",
+    )
+    parser.add_argument(
+        "-o", "--output", default=METADATA_PATH, help="The output file path"
+    )
+    parser.add_argument(
+        "--min-length",
+        type=int,
+        default=TRAINED_MIN_LENGTH,
+        help="The shortest song the weights were trained on",
+    )
+    parser.add_argument(
+        "--max-length",
+        type=int,
+        default=TRAINED_MAX_LENGTH,
+        help="The length songs were truncated to for training",
+    )
+    args = parser.parse_args()
+    dataset = UltimateGuitarSongDataset(args.input, args.min_length, args.max_length)
+    metadata = export_metadata(dataset, args.output)
+    print(f"Exported {len(metadata['unique_chords'])} chords to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
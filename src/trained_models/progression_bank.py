@@ -0,0 +1,206 @@
+import argparse
+import math
+import os
+import threading
+
+import numpy as np
+import torch
+
+try:
+    from ..melolib.corpus import token_dtype
+except ImportError:  # Imported as a top level package, as the backend does
+    from melolib.corpus import token_dtype
+
+from .chord_inference import get_runner
+from .chord_progression import PRESETS, load_chord_model, sample_chord_progressions
+
+BANK_PATH = "out/chord_progression_bank.npz"
+SAMPLES_PER_KEY = 256
+REQUESTS_PER_BATCH = 32
+
+_rng = np.random.default_rng()
+
+
+class ProgressionBank:
+    """Deduplicated sampled progressions for every (key, preset) pair.
+
+    The progressions of a preset are rows of tokens[preset] into vocab, with
+    those of keys[i] in rows offsets[preset][i]:offsets[preset][i + 1], so a
+    lookup is two dictionary reads and a random row.
+    """
+
+    def __init__(self, vocab, keys, tokens, offsets, samples_per_key):
+        self.vocab = np.asarray(vocab, dtype=object)
+        self.keys = list(keys)
+        self.key_indices = {key: i for i, key in enumerate(self.keys)}
+        self.tokens = tokens
+        self.offsets = offsets
+        self.samples_per_key = samples_per_key
+
+    def __contains__(self, request):
+        key, preset_type = request
+        return key in self.key_indices and preset_type in self.tokens
+
+    def progressions(self, key, preset_type):
+        idx = self.key_indices[key]
+        offsets = self.offsets[preset_type]
+        start, end = offsets[idx], offsets[idx + 1]
+        return self.tokens[preset_type][start:end]
+
+    def sample(self, key, preset_type, rng=_rng):
+        # A random banked progression, None if the pair isn't banked
+        if (key, preset_type) not in self:
+            return None
+        rows = self.progressions(key, preset_type)
+        return self.vocab[rows[rng.integers(len(rows))]].tolist()
+
+    def save(self, path=BANK_PATH):
+        arrays = {
+            "vocab": np.array(self.vocab, dtype=str),
+            "keys": np.array(self.keys, dtype=str),
+            "presets": np.array(list(self.tokens), dtype=str),
+            "samples_per_key": np.array(self.samples_per_key),
+        }
+        for preset_type in self.tokens:
+            arrays[f"tokens_{preset_type}"] = self.tokens[preset_type]
+            arrays[f"offsets_{preset_type}"] = self.offsets[preset_type]
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path=BANK_PATH):
+        with np.load(path) as bank:
+            presets = bank["presets"].tolist()
+            return cls(
+                bank["vocab"].tolist(),
+                bank["keys"].tolist(),
+                {p: bank[f"tokens_{p}"] for p in presets},
+                {p: bank[f"offsets_{p}"] for p in presets},
+                int(bank["samples_per_key"]),
+            )
+
+    def stats(self):
+        """Coverage and diversity of every preset.
+
+        unique is the share of sampled progressions left after deduplication,
+        entropy is that of the banked chords in bits.
+        """
+        stats = {}
+        for preset_type, tokens in self.tokens.items():
+            counts = np.diff(self.offsets[preset_type])
+            chord_counts = np.bincount(tokens.ravel(), minlength=len(self.vocab))
+            p = chord_counts[chord_counts > 0] / chord_counts.sum()
+            distinct = [len(np.unique(row)) for row in tokens]
+            stats[preset_type] = {
+                "keys": int((counts > 0).sum()),
+                "progressions": len(tokens),
+                "min_per_key": int(counts.min()),
+                "mean_per_key": float(counts.mean()),
+                "unique": float(counts.mean() / self.samples_per_key),
+                "chords_used": int((chord_counts > 0).sum()),
+                "mean_distinct_chords": float(np.mean(distinct)),
+                "entropy": float(-(p * np.log2(p)).sum()),
+            }
+        return stats
+
+
+def build_bank(
+    keys=None,
+    preset_types=tuple(PRESETS),
+    samples_per_key=SAMPLES_PER_KEY,
+    seed=0,
+    top_k=3,
+    temperature=math.inf,
+):
+    """Samples samples_per_key progressions for every key and preset.
+
+    keys defaults to every chord the model knows. Requests are sampled
+    REQUESTS_PER_BATCH keys at a time with the batched model.
+    """
+    chord_model = load_chord_model()
+    keys = list(chord_model.unique_chords if keys is None else keys)
+    generator = torch.Generator().manual_seed(seed)
+    dtype = token_dtype(len(chord_model.unique_chords))
+    tokens, offsets = {}, {}
+    for preset_type in preset_types:
+        rows, counts = [], []
+        for start in range(0, len(keys), REQUESTS_PER_BATCH):
+            end = start + REQUESTS_PER_BATCH
+            requests = [(key, preset_type) for key in keys[start:end]]
+            samples = sample_chord_progressions(
+                requests, samples_per_key, top_k, None, temperature, generator
+            )
+            for progressions in samples:
+                ids = np.array(
+                    [[chord_model.chord_indices[c] for c in p] for p in progressions],
+                    dtype=dtype,
+                )
+                unique = np.unique(ids, axis=0)
+                rows.append(unique)
+                counts.append(len(unique))
+        tokens[preset_type] = np.concatenate(rows)
+        offsets[preset_type] = np.cumsum([0] + counts, dtype=np.int64)
+    return ProgressionBank(
+        chord_model.unique_chords, keys, tokens, offsets, samples_per_key
+    )
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_bank():
+    # The process wide bank, an empty one if none has been built
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            if os.path.exists(BANK_PATH):
+                _bank = ProgressionBank.load(BANK_PATH)
+            else:
+                _bank = ProgressionBank([], [], {}, {}, 0)
+        return _bank
+
+
+def get_progression(key, preset_type):
+    # A banked progression, sampled live for keys and presets the bank lacks
+    progression = get_bank().sample(key, preset_type)
+    if progression is None:
+        progression = get_runner().sample(key, preset_type)
+    return progression
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "progression_bank", "Samples the chord progression bank the backend serves"
+    )
+    parser.add_argument("-o", "--output", default=BANK_PATH)
+    parser.add_argument(
+        "-n",
+        "--samples",
+        type=int,
+        default=SAMPLES_PER_KEY,
+        help="Progressions sampled per key and preset before deduplication",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--stats", action="store_true", help="Only print the stats of an existing bank"
+    )
+    args = parser.parse_args()
+    if args.stats:
+        bank = ProgressionBank.load(args.output)
+    else:
+        bank = build_bank(samples_per_key=args.samples, seed=args.seed)
+        bank.save(args.output)
+        print(f"Saved {args.output}, {os.path.getsize(args.output):,} bytes")
+    for preset_type, stats in bank.stats().items():
+        print(
+            f"{preset_type}: {stats['keys']}/{len(bank.keys)} keys, "
+            f"{stats['progressions']} progressions "
+            f"(min {stats['min_per_key']}, mean {stats['mean_per_key']:.1f} per key, "
+            f"{stats['unique']:.1%} unique), {stats['chords_used']} chords used, "
+            f"{stats['mean_distinct_chords']:.2f} distinct per progression, "
+            f"entropy {stats['entropy']:.2f} bits"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+from torch.utils.data import DataLoader, random_split
+
+from .chord_progression import (
+    DATASET_PATH,
+    HIDDEN_SIZE,
+    METADATA_PATH,
+    STATE_SIZE,
+    WEIGHTS_PATH,
+    RNNetwork,
+    UltimateGuitarSongDataset,
+    collate_songs,
+    device,
+    export_metadata,
+)
+
+CHECKPOINT_PATH = "out/rnn_chord_progressions_checkpoint.pt"
+LEARNING_RATE = 0.005
+BATCH_SIZE = 64
+EPOCHS = 30
+TOP_K = 5  # A prediction counts as correct if the target is among the top k
+
+
+def masked_nll(log_probs, targets, mask):
+    return torch.nn.functional.nll_loss(log_probs[mask], targets[mask])
+
+
+def run_epoch(model, dataloader, optimizer=None):
+    """Trains on (or with no optimizer, evaluates) one pass over dataloader.
+
+    Returns the mean loss per chord, the top k accuracy and sequences/second.
+    """
+    model.train(optimizer is not None)
+    total_loss, correct, chords, sequences = 0.0, 0, 0, 0
+    start = time.perf_counter()
+    with torch.set_grad_enabled(optimizer is not None):
+        for complexity, inputs, targets, mask in dataloader:
+            complexity, inputs = complexity.to(device), inputs.to(device)
+            targets, mask = targets.to(device), mask.to(device)
+            log_probs, _ = model.forward_sequence(complexity, inputs)
+            loss = masked_nll(log_probs, targets, mask)
+            if optimizer is not None:
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+            num_chords = int(mask.sum())
+            total_loss += loss.item() * num_chords
+            top_k = log_probs.topk(TOP_K, dim=-1).indices
+            hits = (top_k == targets[..., None]).any(dim=-1)
+            correct += int(hits[mask].sum())
+            chords += num_chords
+            sequences += len(inputs)
+    elapsed = time.perf_counter() - start
+    return total_loss / max(chords, 1), correct / max(chords, 1), sequences / elapsed
+
+
+def save_checkpoint(path, model, optimizer, epoch, unique_chords, generator):
+    # Written to a temporary file first so an interrupted save keeps the old one
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    state = {
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "epoch": epoch,
+        "unique_chords": unique_chords,
+        "generator": generator.get_state(),
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+    with os.fdopen(fd, "wb") as f:
+        torch.save(state, f)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, model, optimizer, unique_chords, generator):
+    # Returns the number of epochs already trained
+    state = torch.load(path, map_location=device)
+    if state["unique_chords"] != unique_chords:
+        raise ValueError(f"{path} was trained on a different chord vocabulary")
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    generator.set_state(state["generator"])
+    return state["epoch"]
+
+
+def export_weights(model, dataset, weights_path, metadata_path):
+    # The files load_chord_model reads
+    torch.save(model.state_dict(), weights_path)
+    export_metadata(dataset, metadata_path)
+
+
+def train(args):
+    dataset = UltimateGuitarSongDataset(args.dataset, args.min_length, args.max_length)
+    split = torch.Generator().manual_seed(args.seed)
+    train_dataset, test_dataset = random_split(
+        dataset, [1 - args.validation, args.validation], generator=split
+    )
+    shuffle = torch.Generator().manual_seed(args.seed)
+    loader_options = {
+        "batch_size": args.batch_size,
+        "collate_fn": collate_songs,
+        "num_workers": args.workers,
+        "persistent_workers": args.workers > 0,
+    }
+    train_dataloader = DataLoader(
+        train_dataset, shuffle=True, generator=shuffle, **loader_options
+    )
+    test_dataloader = DataLoader(test_dataset, **loader_options)
+
+    output_size = len(dataset.unique_chords)
+    input_size = output_size + dataset.complexity_size
+    model = RNNetwork(input_size, output_size, HIDDEN_SIZE, STATE_SIZE).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+    print(f"{len(dataset)} songs, {output_size} chords, training on {device}")
+
+    first_epoch = 0
+    if args.resume and Path(args.checkpoint).exists():
+        first_epoch = load_checkpoint(
+            args.checkpoint, model, optimizer, dataset.unique_chords, shuffle
+        )
+        print(f"Resuming after epoch {first_epoch}")
+
+    for epoch in range(first_epoch, args.epochs):
+        train_loss, _, speed = run_epoch(model, train_dataloader, optimizer)
+        test_loss, accuracy, _ = run_epoch(model, test_dataloader)
+        print(
+            f"Epoch {epoch + 1}: train loss {train_loss:.4f}, "
+            f"test loss {test_loss:.4f}, top {TOP_K} accuracy {accuracy:.2%}, "
+            f"{speed:,.0f} sequences/s"
+        )
+        save_checkpoint(
+            args.checkpoint, model, optimizer, epoch + 1, dataset.unique_chords, shuffle
+        )
+
+    export_weights(model, dataset, args.output, args.metadata)
+    print(f"Exported {args.output} and {args.metadata}")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "train_chord_progression", "Trains the chord progression RNN on minibatches"
+    )
+    parser.add_argument(
+        "-i",
+        "--dataset",
+        default=DATASET_PATH,
+        help="The dataset json file or chord corpus directory",
+    )
+    parser.add_argument(
+        "-o", "--output", default=WEIGHTS_PATH, help="The exported weights path"
+    )
+    parser.add_argument(
+        "-m", "--metadata", default=METADATA_PATH, help="The exported metadata path"
+    )
+    parser.add_argument(
+        "-c", "--checkpoint", default=CHECKPOINT_PATH, help="The checkpoint path"
+    )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help="Continue from the checkpoint if there is one",
+    )
+    parser.add_argument("-e", "--epochs", type=int, default=EPOCHS)
+    parser.add_argument("-b", "--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--lr", type=float, default=LEARNING_RATE)
+    parser.add_argument(
+        "-j", "--workers", type=int, default=0, help="The DataLoader worker processes"
+    )
+    parser.add_argument(
+        "--validation", type=float, default=0.2, help="The held out fraction"
+    )
+    parser.add_argument("--min-length", type=int, default=2, help="Skip shorter songs")
+    parser.add_argument(
+        "--max-length", type=int, default=None, help="Truncate longer songs"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    train(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+
+from src.melolib.cache import LRUCache
+
+
+def disk_size(directory):
+    return sum(path.stat().st_size for path in directory.iterdir())
+
+
+def test_disk_store_stays_bounded(tmp_path):
+    cache = LRUCache(maxsize=2, directory=tmp_path, max_disk_bytes=1000)
+    for i in range(50):
+        cache.put(f"key{i}", bytes(100))
+        assert disk_size(tmp_path) <= 1000
+    assert len(list(tmp_path.iterdir())) == 10
+    assert cache.get("key49") == bytes(100)
+    assert cache.get("key0") is None
+
+
+def test_disk_store_keeps_recently_read_entries(tmp_path):
+    cache = LRUCache(maxsize=1, directory=tmp_path, max_disk_bytes=300)
+    for i in range(3):
+        cache.put(f"key{i}", bytes(100))
+        os.utime(cache._path(f"key{i}"), ns=(i, i))
+    cache.get("key0")  # Loaded back from disk, so now the most recently used
+    cache.put("key3", bytes(100))
+    fresh = LRUCache(directory=tmp_path)
+    assert fresh.get("key0") == bytes(100)
+    assert fresh.get("key1") is None
+
+
+def test_directory_created_on_first_spill(tmp_path):
+    directory = tmp_path / "cache" / "songs"
+    cache = LRUCache(directory=directory, max_disk_bytes=1000)
+    assert cache.get("key") is None
+    assert not directory.exists()
+    cache.put("key", b"value")
+    assert LRUCache(directory=directory).get("key") == b"value"
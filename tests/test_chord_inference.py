@@ -0,0 +1,35 @@
+import pytest
+import torch
+
+from src.trained_models.chord_inference import ChordInferenceRunner
+from src.trained_models.chord_progression import ChordModel, RNNetwork
+
+CHORDS = ["Am", "C", "F", "G"]
+
+
+@pytest.fixture(scope="module")
+def runner():
+    torch.manual_seed(0)
+    model = RNNetwork(len(CHORDS) + 3, len(CHORDS), 8, 4).eval()
+    chord_model = ChordModel(
+        CHORDS, {chord: i for i, chord in enumerate(CHORDS)}, 3, model
+    )
+    # A long batching window so all submissions below share one batch
+    return ChordInferenceRunner(chord_model=chord_model, max_wait=0.5, seed=0)
+
+
+def test_invalid_request_fails_alone(runner):
+    futures = [
+        runner.submit("C", "simple"),
+        runner.submit("Hm", "simple"),
+        runner.submit("G", "complex"),
+        runner.submit("F", "unknown"),
+    ]
+    c, hm, g, unknown = (future.exception(timeout=10) for future in futures)
+    assert c is None and g is None
+    assert isinstance(hm, KeyError) and isinstance(unknown, KeyError)
+
+    assert futures[0].result()[0] == "C"
+    assert len(futures[0].result()) == 4
+    assert futures[2].result()[0] == "G"
+    assert set(futures[2].result()) <= set(CHORDS)
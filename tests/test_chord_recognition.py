@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from src.melolib.chord_recognition import label_onset_groups, label_track, recognize
+from src.melolib.midi import NOTE_DTYPE
+from src.melolib.music import Note
+
+
+@pytest.mark.parametrize(
+    "pitches, name",
+    [
+        ((48, 52, 55), "C"),
+        ((52, 55, 60), "C/E"),
+        ((55, 60, 64, 72), "C/G"),
+        ((60,), None),
+    ],
+)
+def test_recognize(pitches, name):
+    assert recognize(pitches) == name
+
+
+@pytest.mark.parametrize(
+    "pitches, name",
+    [
+        ((57, 60, 64, 67), "Am7"),
+        ((48, 52, 55, 57), "C6"),
+        ((43, 57, 60, 64), "Am7/G"),  # Lowest note above the bass is the root
+        ((43, 48, 52, 57), "C6/G"),
+    ],
+)
+def test_m7_and_6_share_notes(pitches, name):
+    assert recognize(pitches) == name
+
+
+@pytest.mark.parametrize(
+    "pitches, name",
+    [
+        ((48, 50, 55), "Csus2"),
+        ((43, 48, 50), "Gsus4"),
+        ((50, 55, 60), "Gsus4/D"),
+        ((50, 60, 67), "Csus2/D"),
+    ],
+)
+def test_sus2_and_sus4_share_notes(pitches, name):
+    assert recognize(pitches) == name
+
+
+def test_recognize_notes():
+    assert recognize([Note(57), Note(60), Note(64)]) == "Am"
+
+
+def test_batch_labels_match_recognize():
+    groups = [(43, 57, 60, 64), (50, 60, 67), (52, 55, 60), (60,), (48, 50, 55)]
+    notes = np.zeros(sum(map(len, groups)), dtype=NOTE_DTYPE)
+    notes["pitch"] = [pitch for group in groups for pitch in reversed(group)]
+    notes["start_tick"] = [i * 480 for i, group in enumerate(groups) for _ in group]
+    starts, labels = label_onset_groups(notes[::-1])
+    assert starts.tolist() == [0, 480, 960, 1440, 1920]
+    assert labels.tolist() == [recognize(group) for group in groups]
+
+
+def test_label_track_of_note_dicts():
+    data = [
+        {"note": "G", "octave": 2, "start_tick": 0},
+        {"note": "A", "octave": 3, "start_tick": 0},
+        {"note": "C", "octave": 4, "start_tick": 0},
+        {"note": "E", "octave": 4, "start_tick": 0},
+    ]
+    starts, labels = label_track(data)
+    assert labels.tolist() == ["Am7/G"]
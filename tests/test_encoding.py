@@ -0,0 +1,99 @@
+import gzip
+import json
+
+import numpy as np
+import pytest
+from werkzeug.datastructures import MIMEAccept
+
+from backend.encoding import (
+    COLUMNS,
+    JSON,
+    MSGPACK,
+    best_format,
+    compress,
+    decode_columns,
+    encode_song,
+)
+
+SONG = {
+    "name": "Song",
+    "midi": {
+        "ticks_per_beat": 480,
+        "tracks": [
+            {
+                "name": "Piano",
+                "data": [
+                    {
+                        "note": "C",
+                        "octave": 4,
+                        "velocity": 0.8,
+                        "start_tick": 0,
+                        "end_tick": 480,
+                    },
+                    {
+                        "note": "G#",
+                        "octave": 3,
+                        "velocity": 0.5,
+                        "start_tick": 480,
+                        "end_tick": 1440,
+                    },
+                ],
+            }
+        ],
+    },
+    "scores": [
+        {
+            "name": "Piano",
+            "key_signature": [["C", 0]],
+            "data": [
+                {
+                    "start_tick": 0,
+                    "end_tick": 480,
+                    "notation": {"keys": ["C/4"], "duration": "q"},
+                },
+                {
+                    "start_tick": 480,
+                    "end_tick": 1440,
+                    "notation": {"keys": ["G#/3"], "duration": "h."},
+                },
+            ],
+        }
+    ],
+}
+
+
+def test_json_is_the_default_format():
+    assert best_format(MIMEAccept([("*/*", 1)])) == JSON
+    assert best_format(MIMEAccept([(COLUMNS, 1), (JSON, 0.5)])) == COLUMNS
+
+
+def test_columns_round_trip():
+    song = decode_columns(encode_song(SONG, COLUMNS))
+    assert song["scores"] == SONG["scores"]
+    (track,) = song["midi"]["tracks"]
+    assert track["data"].tolist() == SONG["midi"]["tracks"][0]["data"]
+
+
+def test_msgpack_columns():
+    msgpack = pytest.importorskip("msgpack")
+    song = msgpack.unpackb(encode_song(SONG, MSGPACK))
+    (track,) = song["midi"]["tracks"]
+    assert track["count"] == 2
+    assert np.frombuffer(track["pitch"], "u1").tolist() == [60, 56]
+    assert np.frombuffer(track["end_tick"], "<u4").tolist() == [480, 1440]
+    (score,) = song["scores"]
+    assert [score["notations"][i] for i in np.frombuffer(score["notation"], "<u4")] == [
+        entry["notation"] for entry in SONG["scores"][0]["data"]
+    ]
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "identity"])
+def test_compress(encoding):
+    body = encode_song(SONG, JSON)
+    if encoding == "br":
+        brotli = pytest.importorskip("brotli")
+        assert brotli.decompress(compress(body, encoding)) == body
+    elif encoding == "gzip":
+        assert json.loads(gzip.decompress(compress(body, encoding))) == SONG
+    else:
+        assert compress(body, encoding) is body
@@ -0,0 +1,79 @@
+import numpy as np
+
+from src.melolib.keys import (
+    KEYS,
+    KeyTracker,
+    estimate_keys,
+    key_errors,
+    key_series,
+    pitch_class_histogram,
+)
+
+C_MAJOR_SCALE = ["C", "D", "E", "F", "G", "A", "B", "C"]
+
+
+def melody(names, ticks_per_beat=480):
+    # One note per beat
+    return [
+        {
+            "note": name,
+            "start_tick": i * ticks_per_beat,
+            "end_tick": (i + 1) * ticks_per_beat,
+        }
+        for i, name in enumerate(names)
+    ]
+
+
+def test_key_errors_count_notes_outside_each_key():
+    histogram = pitch_class_histogram(np.array([0, 2, 4, 5, 7, 9, 11, 6]))
+    errors = dict(zip(KEYS, key_errors(histogram).tolist()))
+    assert errors["C"] == 1  # The F#
+    assert errors["G"] == 1  # The F
+    assert errors["F#"] == 5
+
+
+def test_estimate_keys_orders_by_errors():
+    histograms = [
+        pitch_class_histogram(np.array([0, 2, 4, 5, 7, 9, 11])),
+        pitch_class_histogram(np.array([9, 11, 0, 2, 4, 5, 8])),
+    ]
+    (c_major, a_minor) = estimate_keys(histograms, top=2, minor=True)
+    assert c_major[0] == ("C", 0)
+    assert a_minor[0] == ("Am", 0)
+    assert a_minor[1][1] > 0
+
+
+def test_tracker_matches_recomputing_every_window():
+    rng = np.random.default_rng(0)
+    onsets = np.sort(rng.integers(0, 100, 300))
+    pitch_classes = rng.integers(0, 12, len(onsets))
+    window = 8
+    tracker = KeyTracker(window)
+    added = 0
+    for time in range(1, 101):
+        while added < len(onsets) and onsets[added] < time:
+            tracker.add(onsets[added], pitch_classes[added])
+            added += 1
+        tracker.advance(time)
+        in_window = (onsets >= time - window) & (onsets < time)
+        expected = key_errors(pitch_class_histogram(pitch_classes[in_window]))
+        np.testing.assert_array_equal(tracker.errors, expected)
+        assert len(tracker.notes) == in_window.sum()
+
+
+def test_diatonic_melody_has_one_key():
+    assert key_series(melody(C_MAJOR_SCALE * 8), 480) == [(0, "C")]
+
+
+def test_modulation_and_silence():
+    g_major_scale = ["G", "A", "B", "C", "D", "E", "F#", "G"]
+    notes = melody(C_MAJOR_SCALE * 4 + [None] * 16 + g_major_scale * 4)
+    notes = [note for note in notes if note["note"] is not None]
+    series = key_series(notes, 480)
+    assert [key for _, key in series] == ["C", None, "G"]
+    assert series[1][0] == 39 * 480  # The hop whose window, beats 32 to 40, is empty
+    assert series[2][0] == 48 * 480  # Where the G major notes start
+
+
+def test_too_few_notes_give_no_key():
+    assert key_series(melody(["C", "E"]), 480) == []
@@ -0,0 +1,123 @@
+import struct
+
+import mido
+import numpy as np
+
+from src.melolib.midi import (
+    TrackNotes,
+    columnar_to_dicts,
+    notes_from_dicts,
+    parse_midi,
+    parse_midi_columnar,
+)
+
+
+def varlen(value):
+    data = [value & 0x7F]
+    while value > 0x7F:
+        value >>= 7
+        data.append(0x80 | (value & 0x7F))
+    return bytes(reversed(data))
+
+
+def write_midi(path, tracks, ticks_per_beat=480):
+    # tracks are lists of (delta, raw event bytes), written as is so they can
+    # use running status
+    chunks = [b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), ticks_per_beat)]
+    for events in tracks:
+        body = b"".join(varlen(delta) + bytes(event) for delta, event in events)
+        body += b"\x00\xff\x2f\x00"  # End of track
+        chunks.append(b"MTrk" + struct.pack(">I", len(body)) + body)
+    path.write_bytes(b"".join(chunks))
+    return path
+
+
+def name(text):
+    return [0xFF, 0x03, len(text)] + list(text.encode())
+
+
+def assert_parity(path):
+    expected = parse_midi(path)
+    actual = columnar_to_dicts(parse_midi_columnar(path))
+    assert actual["ticks_per_beat"] == expected["ticks_per_beat"]
+    assert [t["name"] for t in actual["tracks"]] == [
+        t["name"] for t in expected["tracks"]
+    ]
+    for track, expected_track in zip(actual["tracks"], expected["tracks"]):
+        assert isinstance(track["data"], TrackNotes)
+        assert track["data"].tolist() == expected_track["data"]
+    return actual
+
+
+def test_running_status_and_zero_velocity_note_off(tmp_path):
+    events = [
+        (0, name("Lead")),
+        (0, [0x90, 60, 100]),
+        (0, [64, 90]),  # Running status note_on
+        (240, [60, 0]),  # Running status note_on with velocity 0
+        (0, [0xFF, 0x01, 1, 0x41]),  # Meta events keep the running status
+        (240, [64, 0]),
+        (0, [0x80, 67, 0]),  # note_off without a note_on is ignored
+        (0, [0xC0, 5]),  # Program change, one data byte
+        (0, [0x91, 67, 70]),
+        (480, [0x81, 67, 64]),
+        (0, [0xF0, 2, 0x7E, 0xF7]),  # Sysex
+    ]
+    path = write_midi(tmp_path / "running.mid", [events])
+    (track,) = assert_parity(path)["tracks"]
+    assert track["name"] == "Lead"
+    assert [(n["note"], n["start_tick"], n["end_tick"]) for n in track["data"]] == [
+        ("C", 0, 240),
+        ("E", 0, 480),
+        ("G", 480, 960),
+    ]
+
+
+def test_overlapping_notes_of_one_pitch(tmp_path):
+    events = [
+        (0, [0x90, 60, 100]),
+        (120, [0x90, 60, 80]),  # Restarted before the first note ends
+        (120, [0x80, 60, 0]),
+        (120, [0x80, 60, 0]),
+        (0, [0x92, 60, 50]),  # Same pitch on another channel
+        (0, [0x90, 62, 50]),
+        (60, [0x80, 62, 0]),
+        (60, [0x82, 60, 0]),
+    ]
+    path = write_midi(tmp_path / "overlap.mid", [events])
+    (track,) = assert_parity(path)["tracks"]
+    assert len(track["data"]) == 4
+
+
+def test_multiple_tracks(tmp_path):
+    midi = mido.MidiFile(ticks_per_beat=96)
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        track = mido.MidiTrack()
+        track.append(mido.MetaMessage("track_name", name=f"Track {i}"))
+        for _ in range(50):
+            note = int(rng.integers(40, 80))
+            velocity = int(rng.integers(1, 128))
+            track.append(mido.Message("note_on", note=note, velocity=velocity))
+            track.append(
+                mido.Message(
+                    "note_off" if rng.random() < 0.5 else "note_on",
+                    note=note,
+                    velocity=0,
+                    time=int(rng.integers(1, 200)),
+                )
+            )
+        midi.tracks.append(track)
+    midi.tracks.insert(1, mido.MidiTrack([mido.MetaMessage("set_tempo")]))
+    midi.save(tmp_path / "tracks.mid")
+    parsed = assert_parity(tmp_path / "tracks.mid")
+    assert [t["name"] for t in parsed["tracks"]] == ["Track 0", "Track 1", "Track 2"]
+
+
+def test_notes_from_dicts_inverts_track_notes(tmp_path):
+    events = [(0, [0x90, 60, 100]), (10, [62, 40]), (10, [60, 0]), (5, [62, 0])]
+    path = write_midi(tmp_path / "chord.mid", [events])
+    (track,) = parse_midi_columnar(path)["tracks"]
+    notes = notes_from_dicts(TrackNotes(track["notes"]).tolist())
+    for field in ("pitch", "velocity", "start_tick", "end_tick"):
+        np.testing.assert_array_equal(notes[field], track["notes"][field])
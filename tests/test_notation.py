@@ -0,0 +1,94 @@
+import pytest
+
+from src.melolib.notation import (
+    BAR_SEGMENTS,
+    duration_table,
+    generate_score_from_parsed_midi,
+    get_notes_count,
+)
+
+
+def note(name, octave, start_tick, end_tick):
+    return {
+        "note": name,
+        "octave": octave,
+        "velocity": 0.8,
+        "start_tick": start_tick,
+        "end_tick": end_tick,
+    }
+
+
+def score_entries(data):
+    parsed = {"ticks_per_beat": 480, "tracks": [{"name": "Piano", "data": data}]}
+    (score,) = generate_score_from_parsed_midi(parsed)
+    return [
+        (entry["start_tick"], entry["end_tick"], entry["notation"])
+        for entry in score["data"]
+    ]
+
+
+@pytest.mark.parametrize(
+    "length, durations",
+    [
+        (16, ["q"]),
+        (24, ["q."]),
+        (28, ["q.."]),
+        (48, ["h."]),
+        (56, ["h.."]),
+        (40, ["h", "8"]),
+        (64, ["w"]),
+    ],
+)
+def test_bar_segments(length, durations):
+    segments = BAR_SEGMENTS[length]
+    assert [segment.note for segment in segments] == durations
+    assert sum(segment.length for segment in segments) == length
+
+
+def test_split_ties_at_bar_lines():
+    table = duration_table(480)
+    segments = table.split(48, 32)  # Beat 4 for two beats
+    assert [segment.note for segment in segments] == ["q", "q"]
+    assert table.split(0, 144)[:2] == BAR_SEGMENTS[64] * 2
+
+
+def test_note_crossing_a_bar_line():
+    assert score_entries([note("C", 4, 1440, 2400)]) == [
+        (0, 1440, {"keys": ["B/4"], "duration": "hr."}),
+        (1440, 1920, {"keys": ["C/4"], "duration": "q", "tie": True}),
+        (1920, 2400, {"keys": ["C/4"], "duration": "q"}),
+    ]
+
+
+def test_note_longer_than_a_bar():
+    assert score_entries([note("C", 4, 0, 4320)]) == [
+        (0, 1920, {"keys": ["C/4"], "duration": "w", "tie": True}),
+        (1920, 3840, {"keys": ["C/4"], "duration": "w", "tie": True}),
+        (3840, 4320, {"keys": ["C/4"], "duration": "q"}),
+    ]
+
+
+def test_dotted_notes_and_rests():
+    data = [note("C", 4, 0, 720), note("E", 4, 1920, 3600), note("G", 4, 3840, 4320)]
+    assert score_entries(data) == [
+        (0, 720, {"keys": ["C/4"], "duration": "q."}),
+        (720, 1680, {"keys": ["B/4"], "duration": "hr"}),
+        (1680, 1920, {"keys": ["B/4"], "duration": "8r"}),
+        (1920, 3600, {"keys": ["E/4"], "duration": "h.."}),
+        (3600, 3840, {"keys": ["B/4"], "duration": "8r"}),
+        (3840, 4320, {"keys": ["G/4"], "duration": "q"}),
+    ]
+
+
+def test_notes_count_of_generated_score():
+    data = [
+        note("C", 4, 0, 480),
+        note("E", 4, 0, 480),
+        note("G", 4, 960, 3360),  # Tied across the bar line
+        note("C", 5, 3360, 3840),
+    ]
+    parsed = {"ticks_per_beat": 480, "tracks": [{"name": "Piano", "data": data}]}
+    (score,) = generate_score_from_parsed_midi(parsed)
+    counts = get_notes_count(score["data"])
+    assert counts == {**dict.fromkeys(counts, 0), "C": 2, "E": 1, "G": 1}
+    assert len(counts) == 12
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import soundfile
+
+from src.melolib.wav_to_midi import (
+    PYIN_SAMPLE_RATE,
+    iter_pyin_estimated_pitches,
+    wav_to_pyin_estimated_pitches,
+)
+
+# (frequency, seconds) of the clip's tones, 0 for silence
+TONES = [(220, 0.6), (0, 0.3), (261.63, 0.5), (329.63, 0.8), (0, 0.2), (440, 0.7)]
+
+
+def write_clip(path, sample_rate):
+    parts = []
+    for frequency, seconds in TONES:
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        parts.append(0.5 * np.sin(2 * np.pi * frequency * t))
+    soundfile.write(path, np.concatenate(parts).astype(np.float32), sample_rate)
+    return path
+
+
+def transcribe(path):
+    batch = wav_to_pyin_estimated_pitches(path)
+    streamed = list(iter_pyin_estimated_pitches(path, block_duration=0.5, overlap=0.3))
+    return batch, streamed
+
+
+def test_streaming_matches_batch(tmp_path):
+    batch, streamed = transcribe(write_clip(tmp_path / "clip.wav", PYIN_SAMPLE_RATE))
+    assert [note for note, _ in streamed] == [note for note, _ in batch]
+    assert [dt for _, dt in streamed] == pytest.approx([dt for _, dt in batch])
+
+
+def timeline(notes, step=0.01):
+    # The note sounding at every step seconds, -1 for rests
+    ends = np.cumsum([dt for _, dt in notes])
+    codes = [note.note if note is not None else -1 for note, _ in notes]
+    times = np.arange(0, ends[-1], step)
+    return np.array(codes)[
+        np.searchsorted(ends, times, side="right").clip(max=len(ends) - 1)
+    ]
+
+
+def test_streaming_at_44100_stays_close_to_batch(tmp_path):
+    # The native rate frames don't line up with the resampled batch ones, so
+    # note boundaries and short blips may differ
+    batch, streamed = transcribe(write_clip(tmp_path / "clip.wav", 44100))
+    batch, streamed = timeline(batch), timeline(streamed)
+    size = max(len(batch), len(streamed))
+    batch = np.pad(batch, (0, size - len(batch)), constant_values=-2)
+    streamed = np.pad(streamed, (0, size - len(streamed)), constant_values=-2)
+    assert np.mean(batch != streamed) < 0.05